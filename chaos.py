@@ -6,14 +6,20 @@ import json
 import gi
 import os.path
 import time
-import struct
+import numpy as np
 from datetime import datetime
+from decimal import Decimal, localcontext
 from PIL import Image
 
 from utils import *
 from colourPalette import *
 from imageCalc import *
+from imageRender import *
 from histogram import *
+from tileScheduler import *
+from perturbation import *
+from checkpoint import *
+from viewCalc import *
 
 # *******************************************
 # Program history.
@@ -27,7 +33,9 @@ progVersion = "0.1"
 # Program needs Gtk version 3.0.
 # *******************************************
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, Gdk, GdkPixbuf, GLib
+gi.require_foreign('cairo')
+from gi.repository import Gtk, Gdk, GLib
+import cairo
 
 # *******************************************
 # Open configuration file for program constants.
@@ -74,7 +82,7 @@ class Handler:
 # *******************************************
 # Chaos class.
 # *******************************************
-class Mandelbrot():
+class Mandelbrot(viewCalc):
     # Initializer / Instance Attributes
     def __init__(self, window):
 
@@ -90,15 +98,61 @@ class Mandelbrot():
         # Number of iterations to use for calculations.
         self.maxIterations = config["Calculations"]["DefMaxIterations"]
 
+        # Calculation engine, vectorised (numpy) or per pixel.
+        # Vectorised engine calculates blocks of rows at a time.
+        self.vectorEngine = config["Calculations"]["VectorEngine"]
+        self.vectorRowBlock = config["Calculations"]["VectorRowBlock"]
+
+        # Calculation settings (cardioid and periodicity checks, rectangle
+        # subdivision, perturbation and series approximation for deep zooms).
+        self.initCalc(config, logger)
+
+        # Progressive image generation, starting with every n'th pixel.
+        self.progressive = config["Calculations"]["Progressive"]
+        self.progressiveStart = config["Calculations"]["ProgressiveStart"]
+
+        # Image generation in progress, run in the background.
+        # Count of image generations, to ignore results of cancelled ones.
+        # Count of tile or thread calculations not yet finished, and
+        # generation waiting for calculations of a cancelled one to finish.
+        self.genCount = 0
+        self.generation = None
+        self.genBusy = 0
+        self.genPending = None
+        self.imageThread = None
+        self.imageComplete = False
+
+        # Directory for checkpoints of whole image generations, named by
+        # view, and seconds between checkpoints (0 for none), so that a
+        # generation can be resumed.
+        self.checkpointDir = config["Calculations"]["CheckpointDir"]
+        self.checkpointInterval = config["Calculations"]["CheckpointInterval"]
+
+        # Tile scheduler for calculating image on multiple processes.
+        # Single worker uses the image calculation thread instead.
+        self.scheduler = tileScheduler(logger, config["Calculations"]["Workers"], config["Calculations"]["TileSize"])
+
         # Array to hold iteration counts.
-        self.iterations = [[0 for i in range(self.imageWidth)] for j in range(self.imageHeight)]
+        # Held in shared memory so that worker processes can write to it.
+        self.iterBuffer = iterationBuffer(logger, self.imageWidth, self.imageHeight)
+        self.iterations = self.iterBuffer.data
+
+        # State of pixels that reached maximum iterations in the last
+        # whole image generation, to continue them if maximum iterations is raised.
+        self.resumeState = None
+
+        # View of the last whole image generation, for reusing its pixels.
+        self.frame = None
         self.histLinePlot = config["Colours"]["histLinePlot"]
         self.incMaxIterations = config["Colours"]["includeMaxIts"]
         self.logItsCounts = config["Colours"]["logItsCounts"]
+        self.histDerivative = config["Colours"]["histDerivative"]
  
         # Array to hold histogram information.
+        # Histogram is valid if it is up to date with the iterations array.
         self.bins = [(i + 1) for i in range(self.maxIterations)]
-        self.hist = [0 for i in range(self.maxIterations)]
+        self.hist = np.zeros(self.maxIterations, dtype=np.int64)
+        self.histValid = False
         self.lowBin = 0
 
         # Colour palette for rendering.
@@ -106,6 +160,7 @@ class Mandelbrot():
  
         # Rendering flag black or colour palette.
         self.black = config["Colours"]["renderBlack"]
+        self.paletteTableSize = config["Colours"]["paletteTableSize"]
  
         # Histogram plotter.
         self.histogram = histogramPlot(config, logger, builder, self)
@@ -129,6 +184,10 @@ class Mandelbrot():
         imgDataLoadTool = builder.get_object("ImageLoadDataTool")
         imgDataLoadTool.connect('clicked', self.loadPicData)
 
+        # Set up the Resume Image menu item and response.
+        imgResumeItem = builder.get_object("ImageResumeItem")
+        imgResumeItem.connect('activate', self.resumePic)
+
         # Set up the Save Image Data menu item and toolbar icon and response.
         imgDataSaveItem = builder.get_object("ImageSaveDataItem")
         imgDataSaveItem.connect('activate', self.savePicData)
@@ -279,6 +338,7 @@ class Mandelbrot():
         # Block menus as necessary if calculations in progress.
 
         # Inhibit/Enable some menu items during image generation.
+        # No need to check for Gtk events, image generation runs in the background.
         self.MaxItsItem.set_sensitive(idle)
         self.MaxItsTool.set_sensitive(idle)
         self.colEditItem.set_sensitive(idle)
@@ -286,10 +346,6 @@ class Mandelbrot():
         self.plotHistogramItem.set_sensitive(idle)
         self.plotHistogramTool.set_sensitive(idle)
 
-        # Check for Gtk events. Required to update status bar now.
-        while Gtk.events_pending():
-            Gtk.main_iteration()
-
     # *******************************************
     # Zoom image at the current centre at the current zoom factor level.
     # *******************************************
@@ -300,10 +356,6 @@ class Mandelbrot():
         self.statusbar.pop(self.context_id)
         self.statusbar.push(self.context_id, "Zooming image, please wait...")
 
-        # Check for Gtk events. Required to update status bar now.
-        while Gtk.events_pending():
-            Gtk.main_iteration()
-
         # Update pixel size and overall image scale.
         self.pxSize = self.pxSize / self.zoomFactor
         self.imageScale = self.imageScale * self.zoomFactor
@@ -311,19 +363,9 @@ class Mandelbrot():
         logger.debug("Image scale : {0:f}".format(self.imageScale))
 
         # Generate zoomed image at current centre.
-        self.genImage((0, self.imageHeight - 1), (0, self.imageWidth - 1))
-        self.renderImage(self.black)
-
-        # Update image data following image generation.
-        self.updateInfo()
-
-        # Update status bar to wait for image.
-        self.statusbar.pop(self.context_id)
-        self.statusbar.push(self.context_id, "New image generation complete in : {0:s}".format(self.genTime))
-
-        # Check for Gtk events. Required to update status bar now.
-        while Gtk.events_pending():
-            Gtk.main_iteration()
+        # Image data and status bar updated when image generation completes.
+        self.genImage((0, self.imageHeight), (0, self.imageWidth), True,
+            lambda: self.showImage("New image generation complete in : {0:s}"))
 
     # *******************************************
     # Zoom scale changed on slider.
@@ -387,10 +429,6 @@ class Mandelbrot():
             self.statusbar.pop(self.context_id)
             self.statusbar.push(self.context_id, "Recentering image to ({0:d}, {1:d}), please wait...".format(picCentreX, picCentreY))
 
-            # Check for Gtk events. Required to update status bar now.
-            while Gtk.events_pending():
-                Gtk.main_iteration()
-
             # Determine how many pixels to move current image.
             # Positive amount centre moved down or to the right, negative amount centre moved up or to the left.
             self.horizontalMove = picCentreX - self.centrePxX
@@ -398,23 +436,15 @@ class Mandelbrot():
             logger.debug("Image centre translation, horizontal : {0:d}, vertical {1:d}".format(self.horizontalMove, self.verticalMove))
 
             # Determine new centre for image.
-            self.centreReal += (self.horizontalMove * self.pxSize)
-            self.centreImag -= (self.verticalMove * self.pxSize)
+            # Centre held in decimal, with enough precision for the pixel size.
+            with localcontext() as ctx:
+                ctx.prec = decimalDigits(self.pxSize)
+                self.centreReal += (Decimal(self.horizontalMove) * Decimal(self.pxSize))
+                self.centreImag -= (Decimal(self.verticalMove) * Decimal(self.pxSize))
 
-            self.moveImage(self.horizontalMove, self.verticalMove)
-            #self.genImage((0, self.imageHeight - 1), (0, self.imageWidth - 1))
-            self.renderImage(self.black)
-
-            # Update image data following recentring.
-            self.updateInfo()
-
-            # Update status bar to wait for image.
-            self.statusbar.pop(self.context_id)
-            self.statusbar.push(self.context_id, "Image recentre complete in : {0:s}".format(self.genTime))
-
-            # Check for Gtk events. Required to update status bar now.
-            while Gtk.events_pending():
-                Gtk.main_iteration()
+            # Image data and status bar updated when image generation completes.
+            self.moveImage(self.horizontalMove, self.verticalMove, lambda boxes: self.showImage("Image recentre complete in : {0:s}", boxes))
+            #self.genImage((0, self.imageHeight), (0, self.imageWidth))
 
     # *******************************************
     # Rerender the image.
@@ -516,38 +546,16 @@ class Mandelbrot():
         self.statusbar.pop(self.context_id)
         self.statusbar.push(self.context_id, "Recalculating image, please wait...")
 
-        # Check for Gtk events. Required to update status bar now.
-        while Gtk.events_pending():
-            Gtk.main_iteration()
-
         # Generate zoomed image at current centre.
-        self.genImage((0, self.imageHeight - 1), (0, self.imageWidth - 1))
-        self.renderImage(self.black)
-
-        # Update image data following image generation.
-        self.updateInfo()
-
-        # Update status bar to wait for image.
-        self.statusbar.pop(self.context_id)
-        self.statusbar.push(self.context_id, "Image recalculation complete in : {0:s}".format(self.genTime))
-
-        # Check for Gtk events. Required to update status bar now.
-        while Gtk.events_pending():
-            Gtk.main_iteration()
+        # Image data and status bar updated when image generation completes.
+        self.genImage((0, self.imageHeight), (0, self.imageWidth), True,
+            lambda: self.showImage("Image recalculation complete in : {0:s}"))
 
     # *******************************************
     # File/New menu item selected.
     # Starts off with the default Mandlebrot plot.
     # *******************************************
     def initPic(self):
-        # Create pixel buffer for manipulating image.
-        # Initialise buffer to all white (alpha channel ff (not used)).
-        pixbuf = GdkPixbuf.Pixbuf.new(colorspace = GdkPixbuf.Colorspace.RGB, has_alpha = False, bits_per_sample = self.imageColours, width = self.imageWidth, height = self.imageHeight)
-        pixbuf.fill(0xffffffff)
-        logger.debug("Created Gdk pixel buffer of type : {0:s}".format(str(type(pixbuf))))
-        width, height = pixbuf.get_width(), pixbuf.get_height()
-        logger.debug("Gtk image frame width : {0:d}, frame height : {1:d}".format(width, height))
-
         # Associate pixel buffer with main image and show.
         self.gtkPic = builder.get_object("mainImage")
         # Get requested size, which will be maximum size.
@@ -562,18 +570,15 @@ class Mandelbrot():
         self.imageEndY = self.imageStartY + self.imageHeight
         logger.debug("Image in frame coordinates (x, y) start : ({0:d}, {1:d}), end : {2:d}, {3:d})".format(self.imageStartX, self.imageEndX, self.imageStartY, self.imageEndY))
 
-        # Load gtk image form Pixbuf.
-        self.gtkPic.set_from_pixbuf(pixbuf)
-        width, height = pixbuf.get_width(), pixbuf.get_height()
-        logger.debug("Created Gtk image of type : {0:s}, width : {1:d}, height : {2:d}".format(str(type(self.gtkPic)), width, height))
-
-        # Create PIL image version as seems easier to manipulate at pixel level.
-        self.pilPic = Image.frombytes("RGB", (width, height), pixbuf.get_pixels())
-        logger.debug("Created PIL image of type : {0:s}".format(str(type(self.pilPic))))
+        # Load gtk image from the frame buffer.
+        self.initFrameBuffer()
+        self.gtkPic.set_from_surface(self.frameSurface)
+        logger.debug("Created Gtk image of type : {0:s}, width : {1:d}, height : {2:d}".format(str(type(self.gtkPic)), self.imageWidth, self.imageHeight))
 
         # Image coordinates and scale.
-        self.centreReal = config["Calculations"]["DefCentreReal"]
-        self.centreImag = config["Calculations"]["DefCentreImag"]
+        # Centre is held in decimal, so that it keeps its precision in deep zooms.
+        self.centreReal = Decimal(str(config["Calculations"]["DefCentreReal"]))
+        self.centreImag = Decimal(str(config["Calculations"]["DefCentreImag"]))
         self.pxSize = config["Calculations"]["DefPixelSize"]
         self.imageScale = config["Calculations"]["DefScale"]
 
@@ -593,9 +598,6 @@ class Mandelbrot():
     def newPic(self, widget):
         logger.debug("User selected new image control.")
 
-        # Inhibit the some menu items during image generation.
-        self.blockMenus(False)
-
         # Initialise pic to blank image.
         self.initPic()
 
@@ -603,28 +605,11 @@ class Mandelbrot():
         self.statusbar.pop(self.context_id)
         self.statusbar.push(self.context_id, "Generating default image, please wait...")
 
-        # Check for Gtk events. Required to update status bar now.
-        while Gtk.events_pending():
-            Gtk.main_iteration()
-
         # Generate the initial image.
         # Initial image parameters already set up.
-        self.genImage((0, self.imageHeight - 1), (0, self.imageWidth - 1))
-        self.renderImage(self.black)
-
-        # Update image data following recentring.
-        self.updateInfo()
-
-        # Update status bar to wait for image.
-        self.statusbar.pop(self.context_id)
-        self.statusbar.push(self.context_id, "New image generation complete in : {0:s}".format(self.genTime))
-
-        # Check for Gtk events. Required to update status bar now.
-        while Gtk.events_pending():
-            Gtk.main_iteration()
-
-        # Enable menu items inhibited during image generation.
-        self.blockMenus(True)
+        # Image data and status bar updated when image generation completes.
+        self.genImage((0, self.imageHeight), (0, self.imageWidth), True,
+            lambda: self.showImage("New image generation complete in : {0:s}"))
 
     # *******************************************
     # Load image data control selected.
@@ -657,51 +642,39 @@ class Mandelbrot():
 
         # If have a filename then open.
         if fname != "":
-
-            # Open file for binary write.
-            bf = open(fname, 'rb')
-
-            # Read image size from file.
-            dataWidth = struct.unpack('i', bf.read(4))[0]
-            dataHeight = struct.unpack('i', bf.read(4))[0]
-            # Check if iterations array needs to be resized.
-            if ((dataWidth != self.imageWidth) or (dataHeight != self.imageHeight)):
-                # Resize the array to suit data.
-                logger.debug("Resizing iterations array to width : {0:d}, height : {1:d}".format(dataWidth, dataHeight))
-                self.iterations = [[0 for i in range(dataWidth)] for j in range(dataHeight)]
-                self.imageWidth = dataWidth
-                self.imageHeight = dataHeight
-                # Initialise image as size changed.
-                self.initPic()
-            else:
-                self.imageWidth = dataWidth
-                self.imageHeight = dataHeight
-
-            # Read max iterations from file.
-            dataIterations = struct.unpack('i', bf.read(4))[0]
-            # Resize space required for histogram if required.
-            if (dataIterations != self.maxIterations):
-                logger.debug("Resizing histogram arrays to dimension : {0:d}".format(dataIterations))
-                self.bins = [(i + 1) for i in range(dataIterations)]
-                self.hist = [0 for i in range(dataIterations)]
-            # Update maximum iterations.
-            self.maxIterations = dataIterations
-
-            # Read image centre from file.
-            self.centreReal = struct.unpack('f', bf.read(4))[0]
-            self.centreImag = struct.unpack('f', bf.read(4))[0]
-            # Read pixel size from file.
-            self.pxSize = struct.unpack('f', bf.read(4))[0]
-            # Read image scale from file.
-            self.imageScale = struct.unpack('f', bf.read(4))[0]
-
-            # Read iteration data from the file.
-            for r in range (0, self.imageHeight):
-                for c in range (0, self.imageWidth):
-                    self.iterations[r][c] = struct.unpack('f', bf.read(4))[0]
-
-            # Close binary file.
-            bf.close()
+            # Stop any image generation writing to the iterations array.
+            self.stopImage()
+            self.blockMenus(False)
+
+            # Read image details from the file.
+            # Iteration data is memory mapped from the file.
+            try:
+                details, data = readIterationData(fname)
+            except Exception as e:
+                logger.error("Failed to load image data : {0:s} ({1:s})".format(fname, str(e)))
+                self.statusbar.pop(self.context_id)
+                self.statusbar.push(self.context_id, "Failed to load image data : {0:s}".format(fname))
+                self.blockMenus(True)
+                return
+
+            # Loaded data has no state to continue from, or pixels to reuse,
+            # and needs putting into histogram bins.
+            self.resumeState = None
+            self.frame = None
+            self.histValid = False
+
+            # Set image size, max iterations and view from file.
+            self.resizeImage(details["width"], details["height"], details["maxIterations"])
+            self.centreReal = details["centreReal"]
+            self.centreImag = details["centreImag"]
+            self.pxSize = details["pxSize"]
+            self.imageScale = details["imageScale"]
+            logger.debug("Image data file format version : {0:d}".format(details["version"]))
+
+            # Copy iteration data from the file in one go.
+            self.iterations[...] = data
+            del data
+            self.imageComplete = True
 
             self.renderImage(self.black)
 
@@ -716,13 +689,103 @@ class Mandelbrot():
             self.statusbar.pop(self.context_id)
         self.statusbar.push(self.context_id, "Loaded image and completed render in : {0:s}".format(self.genTime))
 
-        # Enable menu items inhibited during image generation.
-        self.blockMenus(True)
+        # Enable menu items inhibited during image generation,
+        # unless still generating an image (load cancelled).
+        self.blockMenus(self.genBusy == 0)
 
         # Check for Gtk events. Required to update status bar now.
         while Gtk.events_pending():
             Gtk.main_iteration()
 
+    # *******************************************
+    # Resume image generation control selected.
+    # Loads a checkpoint of a whole image generation, and calculates only
+    # the tiles that weren't done.
+    # *******************************************
+    def resumePic(self, widget):
+        logger.debug("User selected resume image generation control.")
+
+        # Launch dialog to select checkpoint file to resume from.
+        dlg = Gtk.FileChooserDialog("Resume image generation...", self.myWindow, Gtk.FileChooserAction.OPEN,
+            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_OPEN, Gtk.ResponseType.OK))
+        f = Gtk.FileFilter()
+        f.set_name("Checkpoint Files")
+        f.add_pattern("*.ckpt")
+        dlg.add_filter(f)
+        dlg.set_current_folder(os.path.abspath(self.checkpointDir))
+        response = dlg.run()
+
+        # Check for positive response, and get filename.
+        fname = ""
+        if ((response == Gtk.ResponseType.OK) or (response == Gtk.STOCK_OPEN)):
+            fname = dlg.get_filename()
+
+        # Destroy dialog.
+        dlg.destroy()
+
+        if fname == "":
+            return
+
+        # Stop any image generation writing to the iterations array.
+        self.stopImage()
+        try:
+            checkpoint, iterations = readCheckpoint(logger, fname, self.checkpointInterval)
+        except Exception as e:
+            logger.error("Failed to read checkpoint : {0:s} ({1:s})".format(fname, str(e)))
+            self.statusbar.pop(self.context_id)
+            self.statusbar.push(self.context_id, "Failed to read checkpoint : {0:s}".format(fname))
+            return
+
+        # Checkpoint has no state to continue from, or pixels to reuse,
+        # and needs putting into histogram bins.
+        self.resumeState = None
+        self.frame = None
+        self.histValid = False
+
+        # Set view of checkpoint, and show the tiles done.
+        view = checkpoint.view
+        self.resizeImage(view["imageWidth"], view["imageHeight"], view["maxIterations"])
+        self.centreReal = Decimal(view["centreReal"])
+        self.centreImag = Decimal(view["centreImag"])
+        self.pxSize = view["pxSize"]
+        self.imageScale = view["imageScale"]
+        self.iterations[...] = iterations
+        self.renderImage(self.black)
+        self.updateInfo()
+
+        # Update status bar to wait for image.
+        self.statusbar.pop(self.context_id)
+        self.statusbar.push(self.context_id, "Resuming image generation, please wait...")
+
+        # Calculate the tiles not done.
+        # Image data and status bar updated when image generation completes.
+        self.genImage((0, self.imageHeight), (0, self.imageWidth), False,
+            lambda: self.showImage("Image generation resumed and complete in : {0:s}"), checkpoint)
+
+    # *******************************************
+    # Change image size and maximum iterations, e.g. for loaded image data.
+    # Iterations array, image and histogram arrays are resized if needed.
+    # *******************************************
+    def resizeImage(self, width, height, maxIterations):
+        # Check if iterations array needs to be resized.
+        if ((width != self.imageWidth) or (height != self.imageHeight)):
+            # Resize the array to suit data.
+            logger.debug("Resizing iterations array to width : {0:d}, height : {1:d}".format(width, height))
+            self.iterBuffer.resize(width, height)
+            self.iterations = self.iterBuffer.data
+            self.imageWidth = width
+            self.imageHeight = height
+            # Initialise image as size changed.
+            self.initPic()
+
+        # Resize space required for histogram if required.
+        if (maxIterations != self.maxIterations):
+            logger.debug("Resizing histogram arrays to dimension : {0:d}".format(maxIterations))
+            self.bins = [(i + 1) for i in range(maxIterations)]
+            self.hist = np.zeros(maxIterations, dtype=np.int64)
+        # Update maximum iterations.
+        self.maxIterations = maxIterations
+
     # *******************************************
     # Save image data control selected.
     # *******************************************
@@ -753,29 +816,8 @@ class Mandelbrot():
             pre, ext = os.path.splitext(fname)
             fname = pre + '.dat'
 
-            # Open file for binary write.
-            bf = open(fname, 'wb')
-
-            # Write image size to file.
-            bf.write(struct.pack('i', self.imageWidth))
-            bf.write(struct.pack('i', self.imageHeight))
-            # Write max iterations to file.
-            bf.write(struct.pack('i', self.maxIterations))
-            # Write image centre to file.
-            bf.write(struct.pack('f', self.centreReal))
-            bf.write(struct.pack('f', self.centreImag))
-            # Write pixel size to file.
-            bf.write(struct.pack('f', self.pxSize))
-            # Write image scale to file.
-            bf.write(struct.pack('f', self.imageScale))
-
-            # Write iteration data to the file.
-            for r in range (0, self.imageHeight):
-                for c in range (0, self.imageWidth):
-                    bf.write(struct.pack('f', self.iterations[r][c]))
-
-            # Close binary file.
-            bf.close()
+            # Write image details and iteration data to the file.
+            writeIterationData(fname, self.iterations, self.maxIterations, self.centreReal, self.centreImag, self.pxSize, self.imageScale)
 
             # Update status bar to wait for image.
             self.statusbar.pop(self.context_id)
@@ -815,7 +857,9 @@ class Mandelbrot():
             pre, ext = os.path.splitext(fname)
             fname = pre + '.png'
 
-            self.pilPic.save(fname)
+            # Only need PIL image when exporting, so create it from the frame buffer here.
+            pilPic = Image.fromarray(unpackPixels(self.framePixels), "RGB")
+            pilPic.save(fname)
 
         # Update status bar to wait for image.
         self.statusbar.pop(self.context_id)
@@ -943,167 +987,764 @@ class Mandelbrot():
     # Performs calculations for the image.
     # Image calculation works on row/column ranges, i.e. a box.
     # Complete image so specify full image size for row/column ranges.
+    # If progressive, first calculates a coarse grid of pixels, then finer
+    # grids, rendering the image after each grid (pass).
+    # Calculation runs in the background; onDone is called from the Gtk
+    # main loop when the image is complete.
+    # Any image generation in progress is cancelled. Its onDone isn't called.
+    # If tiles of the cancelled generation are still being calculated,
+    # this one starts when they finish; if generations are requested
+    # again in the meantime, only the last one is started.
+    # If a checkpoint of the whole image is given, only its tiles not done
+    # are calculated, see resumePic.
     # *******************************************
-    def genImage(self, rowRange, colRange):
-        # Start time for image generation timing.
-        startTime = datetime.now()
+    def genImage(self, rowRange, colRange, progressive=False, onDone=None, checkpoint=None):
+        self.cancelImage()
+
+        if self.genBusy > 0:
+            logger.debug("Image generation waiting for cancelled calculations : {0:d}".format(self.genBusy))
+            self.genPending = (rowRange, colRange, progressive, onDone, checkpoint)
+        else:
+            self.startImage(rowRange, colRange, progressive, onDone, checkpoint)
+
+    # *******************************************
+    # Cancel the image generation in progress, if any.
+    # Tiles not started are cancelled, and the calculation thread stopped.
+    # Results of calculations still running are ignored.
+    # *******************************************
+    def cancelImage(self):
+        # Count this image generation; results for earlier counts are ignored.
+        self.genCount += 1
+        self.scheduler.cancel()
+        if self.imageThread is not None:
+            self.imageThread.cancel()
 
-        # Launch thread to calculate image.
-        imageThread = imageCalc(1, "CalcImage", logger, self, rowRange, colRange)
-        imageThread.start()
+    # *******************************************
+    # Stop any image generation, waiting for calculations to finish.
+    # Used before changing the iterations array other than by generating an image.
+    # *******************************************
+    def stopImage(self):
+        self.cancelImage()
+        self.genPending = None
+        while self.genBusy > 0:
+            Gtk.main_iteration()
+        self.blockMenus(True)
+
+    # *******************************************
+    # Start generating an image.
+    # Works out the calculations needed for the box, then starts the first pass.
+    # Whole image generations on the process pool are checkpointed.
+    # *******************************************
+    def startImage(self, rowRange, colRange, progressive, onDone, checkpoint=None):
+        # Inhibit the some menu items during image generation.
+        self.blockMenus(False)
+        self.imageComplete = False
+
+        gen = {
+            "count" : self.genCount,
+            "rowRange" : rowRange,
+            "colRange" : colRange,
+            "onDone" : onDone,
+            "startTime" : datetime.now(),
+            "steps" : [1],
+            "prevStep" : 0,
+            "resume" : None,
+            "reuse" : None,
+            "mirror" : None,
+            "keepState" : False,
+            "state" : newState(),
+            "stats" : {},
+            "hist" : np.zeros(self.maxIterations, dtype=np.int64),
+            "prevHist" : self.hist if self.histValid else None,
+            "checkpoint" : None,
+            "workers" : self.scheduler.workers
+        }
+        self.generation = gen
+
+        # Histogram is out of date until the generation completes.
+        self.histValid = False
+
+        # Get the reference orbit for deep zooms.
+        # Work out iterations that can be skipped using series approximation.
+        self.updateReference()
+
+        # Continue from the last image generation if only maximum iterations was raised.
+        gen["resume"] = self.resumeJobs(rowRange, colRange)
+
+        if gen["resume"] is not None:
+            gen["keepState"] = True
+            self.resumeState = None
+            self.frame = None
+            self.submitJobs(gen["resume"])
+        elif checkpoint is not None:
+            # Calculate the tiles of the checkpoint not done, whole and in one pass.
+            # Histogram starts with the tiles done. Keeps checkpointing.
+            self.resumeState = None
+            self.frame = None
+            gen["checkpoint"] = checkpoint
+            gen["hist"] = histogramCounts(self.iterations[checkpoint.doneMask()], self.maxIterations)
+            gen["tiles"] = checkpoint.missingTiles()
+            logger.debug("Resuming {0:d} tiles of {1:d} from checkpoint on {2:d} workers.".format(len(gen["tiles"]), checkpoint.done.size, self.scheduler.workers))
+            self.startPass()
+        elif self.scheduler.workers > 1:
+            # Reuse pixels of the last image that line up exactly with pixels of this one.
+            gen["reuse"] = self.reusePixels(rowRange, colRange)
+
+            # Keep state of pixels reaching maximum iterations if whole image calculated.
+            # Perturbation calculations don't have state to keep, and neither
+            # do reused pixels if the last image didn't keep state.
+            gen["keepState"] = (not self.deepZoom()) and self.wholeImage(rowRange, colRange)
+            reuse = gen["reuse"]
+            if reuse is not None:
+                self.iterations[np.ix_(reuse["rowPixels"], reuse["colPixels"])] = reuse["values"]
+                if reuse["state"] is None:
+                    gen["keepState"] = False
+                else:
+                    addState(gen["state"], reuse["state"]["rows"], reuse["state"]["cols"], reuse["state"]["fn"], reuse["state"]["its"])
+
+            self.resumeState = None
+            self.frame = None
+
+            # Rows that are mirror images of other rows about the real axis.
+            gen["mirror"] = self.mirrorRows(rowRange)
+
+            # Pixel spacing for each pass, finishing with every pixel.
+            if progressive and self.progressive:
+                step = self.progressiveStart
+                gen["steps"] = []
+                while step > 1:
+                    gen["steps"].append(step)
+                    step = step // 2
+                gen["steps"].append(1)
+
+            # Checkpoint the tiles of a whole image as they are done in the last pass.
+            if self.wholeImage(rowRange, colRange) and (self.checkpointInterval > 0):
+                view = self.checkpointView()
+                gen["checkpoint"] = renderCheckpoint(logger, viewCheckpointName(self.checkpointDir, view), view, self.scheduler.tileSize, self.checkpointInterval)
+
+            # Split box into tiles and calculate on the process pool.
+            gen["tiles"] = self.scheduler.splitBox(rowRange, colRange)
+            logger.debug("Calculating {0:d} tiles on {1:d} workers.".format(len(gen["tiles"]), self.scheduler.workers))
+            self.startPass()
+        else:
+            # Launch thread to calculate image.
+            # Thread calculation doesn't keep state.
+            self.resumeState = None
+            self.frame = None
+            gen["workers"] = 1
+            self.genBusy = 1
+            self.imageThread = imageCalc(1, "CalcImage", logger, self, rowRange, colRange,
+                lambda thread: GLib.idle_add(self.threadDone, thread, gen["count"]))
+            self.imageThread.start()
 
-        # Wait for thread to end.
-        # Check until only 1 thread left; sleep inbetween checks.
-        while (threading.active_count() > 1):
-            time.sleep(config["Calculations"]["ThreadChkDelay"])
+    # *******************************************
+    # Start the next pass of the image generation on the process pool.
+    # Tiles are written directly into the shared iterations array.
+    # *******************************************
+    def startPass(self):
+        gen = self.generation
+        step = gen["steps"][0]
+
+        # Tiles of the last pass put their rows into histogram bins,
+        # except mirrored rows which are filled in after the pass.
+        histRows = self.passRows(1, gen["mirror"]) if step == 1 else None
+        jobs = [self.tileJob(t[0], t[1], self.passSelection(t[0], t[1], step, gen["prevStep"], gen["reuse"], gen["mirror"]), gen["keepState"],
+            None if histRows is None else histRows[t[0][0]:t[0][1]]) for t in gen["tiles"]]
+        self.submitJobs(jobs)
+
+    # *******************************************
+    # Submit tile jobs of the image generation to the process pool.
+    # Each tile is reported done through the Gtk main loop.
+    # *******************************************
+    def submitJobs(self, jobs):
+        genCount = self.generation["count"]
+        self.genBusy = len(jobs) + 1
+        self.scheduler.submit(jobs, lambda future: GLib.idle_add(self.tileDone, future, genCount))
+
+        # Extra count held while submitting, so that the jobs can't all be
+        # reported done before they have all been submitted, e.g. no jobs.
+        self.workDone(genCount)
+
+    # *******************************************
+    # Tile calculation finished, or cancelled.
+    # Called from the Gtk main loop, with the count of the image generation
+    # the tile is for.
+    # Combines tile calculation statistics, state and histograms, and
+    # marks tiles of the last pass done in the checkpoint.
+    # *******************************************
+    def tileDone(self, future, genCount):
+        if (genCount == self.genCount) and (not future.cancelled()):
+            if future.exception() is not None:
+                logger.error("Tile calculation failed : {0:s}".format(str(future.exception())))
+            else:
+                tileRows, tileCols, tileStats, tileState, tileHist = future.result()
+                stats = self.generation["stats"]
+                for key, value in tileStats.items():
+                    stats[key] = stats.get(key, 0) + value
+                if tileState is not None:
+                    addState(self.generation["state"], tileState["rows"], tileState["cols"], tileState["fn"], tileState["its"])
+                if tileHist is not None:
+                    self.generation["hist"] += tileHist
+                checkpoint = self.generation["checkpoint"]
+                if (checkpoint is not None) and (self.generation["steps"][0] == 1):
+                    checkpoint.tileDone(tileRows, tileCols)
+                    if checkpoint.due():
+                        self.writeCheckpoint()
+        self.workDone(genCount)
+
+        # Don't call again.
+        return False
+
+    # *******************************************
+    # Image calculation thread finished, or cancelled.
+    # Called from the Gtk main loop.
+    # *******************************************
+    def threadDone(self, thread, genCount):
+        if genCount == self.genCount:
+            gen = self.generation
+            gen["stats"] = thread.stats
+            gen["hist"] = histogramCounts(self.iterations[gen["rowRange"][0]:gen["rowRange"][1], gen["colRange"][0]:gen["colRange"][1]], self.maxIterations)
+        self.imageThread = None
+        self.workDone(genCount)
+
+        # Don't call again.
+        return False
+
+    # *******************************************
+    # Tile or thread calculation finished.
+    # When all calculations are done, either the pass is complete,
+    # or a cancelled generation has finished and the next can start.
+    # *******************************************
+    def workDone(self, genCount):
+        self.genBusy -= 1
+        if self.genBusy > 0:
+            return
+
+        if genCount != self.genCount:
+            if self.genPending is not None:
+                rowRange, colRange, progressive, onDone, checkpoint = self.genPending
+                self.genPending = None
+                self.startImage(rowRange, colRange, progressive, onDone, checkpoint)
+        elif (self.generation["resume"] is not None) or (self.generation["workers"] == 1):
+            self.finishImage()
+        else:
+            self.passDone()
+
+    # *******************************************
+    # Progressive pass complete.
+    # Shows the image so far, and starts the next pass.
+    # *******************************************
+    def passDone(self):
+        gen = self.generation
+        rowRange = gen["rowRange"]
+        colRange = gen["colRange"]
+        mirror = gen["mirror"]
+        reuse = gen["reuse"]
+        step = gen["steps"].pop(0)
+        gen["prevStep"] = step
+
+        # Fill in mirrored rows from the rows they mirror.
+        if mirror is not None:
+            self.iterations[mirror["rows"], colRange[0]:colRange[1]] = self.iterations[mirror["sources"], colRange[0]:colRange[1]]
+
+        if step == 1:
+            if mirror is not None:
+                gen["hist"] += histogramCounts(self.iterations[mirror["rows"], colRange[0]:colRange[1]], self.maxIterations)
+            self.finishImage()
+            return
+
+        # Show the image so far.
+        # Keep pixels calculated off the pass grid, in rows mirrored onto it.
+        extraRows = np.nonzero(self.passRows(step, mirror) & ((np.arange(self.imageHeight) % step) != 0))[0]
+        gridCols = np.arange(((colRange[0] + step - 1) // step) * step, colRange[1], step)
+        extra = self.iterations[np.ix_(extraRows, gridCols)]
+        self.fillPreview(rowRange, colRange, step)
+        self.iterations[np.ix_(extraRows, gridCols)] = extra
+        if reuse is not None:
+            self.iterations[np.ix_(reuse["rowPixels"], reuse["colPixels"])] = reuse["values"]
+        self.renderImage(self.black)
+        logger.debug("Progressive pass complete, pixel spacing : {0:d}".format(step))
+
+        self.startPass()
+
+    # *******************************************
+    # Image generation complete.
+    # Keeps details for later generations, logs calculation statistics,
+    # and calls the generation's onDone.
+    # *******************************************
+    def finishImage(self):
+        gen = self.generation
+        rowRange = gen["rowRange"]
+        colRange = gen["colRange"]
+        stats = gen["stats"]
+        self.imageComplete = True
+
+        if gen["keepState"]:
+            self.resumeState = {
+                "view" : self.viewKey(rowRange, colRange),
+                "maxIterations" : self.maxIterations,
+                "state" : self.mirrorState(joinState(gen["state"]), gen["mirror"])
+            }
+            logger.debug("Pixels kept to continue at higher maximum iterations : {0:d}".format(self.resumeState["state"]["rows"].size))
+
+        # Pixels of a whole image can be reused by the next image generation.
+        if self.wholeImage(rowRange, colRange):
+            self.frame = {
+                "view" : self.viewKey(rowRange, colRange),
+                "maxIterations" : self.maxIterations
+            }
+
+        if gen["resume"] is not None:
+            logger.debug("Pixels continued from maximum iterations state : {0:d}".format(stats.get("resumed", 0)))
+        if self.cardioidCheck:
+            logger.debug("Pixels skipped in main cardioid and period-2 bulb : {0:d}".format(stats.get("cardioidSkipped", 0)))
+        if self.periodCheck:
+            logger.debug("Pixels stopped as periodic : {0:d}".format(stats.get("periodic", 0)))
+        if self.subdivide:
+            logger.debug("Pixels filled by rectangle subdivision : {0:d}".format(stats.get("subdivideFilled", 0)))
+        if self.deepZoom():
+            logger.debug("Perturbation rebases from reference orbit : {0:d}".format(stats.get("rebased", 0)))
 
         # End time and image generation elapsed time.
+        # Include number of workers so speed-up can be compared,
+        # and iterations skipped by series approximation.
         endTime = datetime.now()
-        self.genTime = "{0:s}".format(str(endTime - startTime))
+        if self.seriesSkip > 0:
+            self.genTime = "{0:s} ({1:d} workers, {2:d} iterations skipped)".format(str(endTime - gen["startTime"]), gen["workers"], self.seriesSkip)
+        else:
+            self.genTime = "{0:s} ({1:d} workers)".format(str(endTime - gen["startTime"]), gen["workers"])
+        logger.debug("Image generation time : {0:s}".format(self.genTime))
+
+        # Histogram of whole image is the histogram of the generation.
+        # Continuing pixels changes the last histogram.
+        if gen["resume"] is not None:
+            if gen["prevHist"] is not None:
+                self.hist = np.zeros(self.maxIterations, dtype=np.int64)
+                self.hist[:gen["prevHist"].size] = gen["prevHist"]
+                self.hist += gen["hist"]
+                self.histValid = True
+        elif self.wholeImage(rowRange, colRange):
+            self.hist = gen["hist"]
+            self.histValid = True
+
+        # Image is complete, so its checkpoint isn't needed to resume it.
+        if gen["checkpoint"] is not None:
+            gen["checkpoint"].remove()
 
         # If auto-update histogram then update.
-        if ((self.autoHistogram == True) & (self.histogramPresent == True)):
+        # Histogram of a box of the image is updated by the caller.
+        if ((self.autoHistogram == True) & (self.histogramPresent == True) & self.histValid):
             self.histogram.plotHistogram()
 
+        # Enable menu items inhibited during image generation.
+        self.blockMenus(True)
+
+        if gen["onDone"] is not None:
+            gen["onDone"]()
+
+    # *******************************************
+    # Show the generated image, and report it complete in the status bar.
+    # Message has a placeholder for the image generation time.
+    # *******************************************
+    def showImage(self, message, boxes=None):
+        self.renderImage(self.black, boxes)
+
+        # Update image data following image generation.
+        self.updateInfo()
+
+        # Update status bar to show image complete.
+        self.statusbar.pop(self.context_id)
+        self.statusbar.push(self.context_id, message.format(self.genTime))
+
+    # *******************************************
+    # Write checkpoint of the image generation.
+    # Mirrored rows are only filled in at the end of the last pass, so they
+    # are filled in from the rows they mirror for the checkpoint, and tiles
+    # with mirrored rows are only done if the tiles they mirror are done.
+    # *******************************************
+    def writeCheckpoint(self):
+        gen = self.generation
+        checkpoint = gen["checkpoint"]
+        mirror = gen["mirror"]
+        if (mirror is None) or self.imageComplete:
+            checkpoint.write(self.iterations)
+            return
+
+        rowTiles = np.arange(self.imageHeight) // checkpoint.tileSize
+        done = checkpoint.done.copy()
+        np.logical_and.at(done, rowTiles[mirror["rows"]], checkpoint.done[rowTiles[mirror["sources"]]])
+        iterations = self.iterations.copy()
+        iterations[mirror["rows"]] = iterations[mirror["sources"]]
+        checkpoint.write(iterations, done)
+
+    # *******************************************
+    # Write checkpoint of an image generation in progress, if it is being
+    # checkpointed and has started its last pass.
+    # Used when the program is closed.
+    # *******************************************
+    def closeCheckpoint(self):
+        gen = self.generation
+        if ((gen is not None) and (gen["count"] == self.genCount) and (not self.imageComplete)
+            and (gen["checkpoint"] is not None) and (gen["steps"][0] == 1)):
+            self.writeCheckpoint()
+
+    # *******************************************
+    # Jobs to continue the last image generation at higher maximum iterations.
+    # Only pixels that reached the old maximum iterations are calculated,
+    # continuing from their last function values. Pixels that diverged
+    # keep their values.
+    # Only possible if the view and box haven't changed since the last
+    # whole image generation, and maximum iterations hasn't been lowered.
+    # Returns list of jobs, or None if not possible.
+    # *******************************************
+    def resumeJobs(self, rowRange, colRange):
+        if ((self.resumeState is None) or (self.scheduler.workers <= 1) or self.deepZoom()
+            or (self.resumeState["view"] != self.viewKey(rowRange, colRange))
+            or (self.maxIterations < self.resumeState["maxIterations"])):
+            return None
+
+        # Split pixels into jobs of about a tile in size.
+        state = self.resumeState["state"]
+        chunk = self.scheduler.tileSize * self.scheduler.tileSize
+        jobs = []
+        for start in range (0, state["rows"].size, chunk):
+            job = self.tileJob(None, None)
+            job["resume"] = tuple(state[key][start:start + chunk] for key in ("rows", "cols", "fn", "its"))
+            jobs.append(job)
+        return jobs
+
+    # *******************************************
+    # Find pixels of the last whole image that can be reused.
+    # Pixels are reused where the new pixel is exactly the same point as
+    # an old pixel, e.g. every other pixel zooming in by a factor of 2 at
+    # the same centre, or the overlap of views with the same pixel size.
+    # Last image must be the same size with the same maximum iterations.
+    # Returns None if no pixels can be reused, otherwise dictionary of:
+    #   "rows", "cols" - boolean arrays of image rows and columns of reused pixels.
+    #   "rowPixels", "colPixels" - image rows and columns of reused pixels.
+    #   "values" - reused fractional divergence values.
+    #   "state" - state of reused pixels reaching maximum iterations, or None.
+    # *******************************************
+    def reusePixels(self, rowRange, colRange):
+        if ((self.frame is None) or (self.frame["maxIterations"] != self.maxIterations)
+            or (self.scheduler.workers <= 1)):
+            return None
+        oldReal, oldImag, oldPxSize, width, height, oldRowRange, oldColRange = self.frame["view"]
+        if (width != self.imageWidth) or (height != self.imageHeight):
+            return None
+
+        # Distance of the new centre from the old in old pixels.
+        # Worked out in decimal, to be exact for deep zooms.
+        with localcontext() as ctx:
+            ctx.prec = decimalDigits(min(self.pxSize, oldPxSize))
+            shiftCols = float((self.centreReal - oldReal) / Decimal(oldPxSize))
+            shiftRows = float((oldImag - self.centreImag) / Decimal(oldPxSize))
+        ratio = self.pxSize / oldPxSize
+
+        rows, oldRows = alignPixels(shiftRows, ratio, height, rowRange, oldRowRange)
+        cols, oldCols = alignPixels(shiftCols, ratio, width, colRange, oldColRange)
+        if (oldRows.size == 0) or (oldCols.size == 0):
+            return None
+
+        reuse = {
+            "rows" : rows,
+            "cols" : cols,
+            "rowPixels" : np.nonzero(rows)[0],
+            "colPixels" : np.nonzero(cols)[0],
+            "values" : self.iterations[np.ix_(oldRows, oldCols)],
+            "state" : None
+        }
+
+        # Move state of reused pixels to their new rows and columns.
+        if (self.resumeState is not None) and (self.resumeState["view"] == self.frame["view"]):
+            oldState = self.resumeState["state"]
+            newRow = np.full(height, -1, dtype=np.int32)
+            newRow[oldRows] = reuse["rowPixels"]
+            newCol = np.full(width, -1, dtype=np.int32)
+            newCol[oldCols] = reuse["colPixels"]
+            keep = (newRow[oldState["rows"]] >= 0) & (newCol[oldState["cols"]] >= 0)
+            reuse["state"] = {
+                "rows" : newRow[oldState["rows"][keep]],
+                "cols" : newCol[oldState["cols"][keep]],
+                "fn" : oldState["fn"][keep],
+                "its" : oldState["its"][keep]
+            }
+
+        logger.debug("Pixels reused from last image : {0:d}".format(oldRows.size * oldCols.size))
+        return reuse
+
+    # *******************************************
+    # Find rows of a box that mirror other rows of the box.
+    # The set is symmetric about the real axis, so a row whose imaginary
+    # part is the negative of another row's is a mirror image of it.
+    # Needs the real axis to be on a row or exactly half way between rows.
+    # Rows below the real axis are mirrored from the rows above it.
+    # Returns None if no rows are mirrored, otherwise dictionary of:
+    #   "rows" - image rows that are mirrored.
+    #   "sources" - image rows they are mirrored from.
+    # *******************************************
+    def mirrorRows(self, rowRange):
+        # Twice the distance of the real axis from the image centre, in pixels.
+        with localcontext() as ctx:
+            ctx.prec = decimalDigits(self.pxSize)
+            axis = float((2 * self.centreImag) / Decimal(self.pxSize))
+        if abs(axis - round(axis)) >= alignTolerance:
+            return None
+
+        # Row r mirrors row (height + axis - r).
+        rows = np.arange(rowRange[0], rowRange[1])
+        sources = (self.imageHeight + int(round(axis))) - rows
+        mirrored = (sources >= rowRange[0]) & (sources < rowRange[1]) & (sources < rows)
+        if not mirrored.any():
+            return None
+
+        logger.debug("Rows mirrored about the real axis : {0:d}".format(int(mirrored.sum())))
+        return {"rows" : rows[mirrored], "sources" : sources[mirrored]}
+
+    # *******************************************
+    # Rows of the image calculated in a progressive pass.
+    # Rows on the pass grid, except mirrored rows are swapped for the
+    # rows they are mirrored from.
+    # Returns boolean array of image rows.
+    # *******************************************
+    def passRows(self, step, mirror):
+        rows = (np.arange(self.imageHeight) % step) == 0
+        if mirror is not None:
+            sources = mirror["sources"][rows[mirror["rows"]]]
+            rows[mirror["rows"]] = False
+            rows[sources] = True
+        return rows
+
+    # *******************************************
+    # Add state of mirrored pixels reaching maximum iterations.
+    # Mirrored pixels have the state of the pixels they are mirrored from,
+    # with the function value reflected in the real axis.
+    # *******************************************
+    def mirrorState(self, state, mirror):
+        if mirror is None:
+            return state
+
+        # Drop any state of mirrored rows (e.g. from reused pixels) so it isn't duplicated.
+        mirrorOf = np.full(self.imageHeight, -1, dtype=np.int32)
+        mirrorOf[mirror["sources"]] = mirror["rows"]
+        isMirrored = np.zeros(self.imageHeight, dtype=bool)
+        isMirrored[mirror["rows"]] = True
+        keep = ~isMirrored[state["rows"]]
+        mirrored = keep & (mirrorOf[state["rows"]] >= 0)
+
+        newState = {key : [value[keep]] for key, value in state.items()}
+        addState(newState, mirrorOf[state["rows"][mirrored]], state["cols"][mirrored], np.conj(state["fn"][mirrored]), state["its"][mirrored])
+        return joinState(newState)
+
+    # *******************************************
+    # Check if a box is the whole image.
+    # *******************************************
+    def wholeImage(self, rowRange, colRange):
+        return ((rowRange[0] == 0) and (colRange[0] == 0)
+            and (rowRange[1] >= self.imageHeight) and (colRange[1] >= self.imageWidth))
+
+    # *******************************************
+    # Details of the view and box of an image generation.
+    # Used to check if state from an earlier generation can be continued.
+    # *******************************************
+    def viewKey(self, rowRange, colRange):
+        return (self.centreReal, self.centreImag, self.pxSize, self.imageWidth, self.imageHeight, rowRange, colRange)
+
+    # *******************************************
+    # Pixel selection for a tile in a progressive pass.
+    # Pass calculates pixels on grid of spacing step that weren't
+    # calculated on the previous pass grid, or reused from the last image.
+    # Grids are aligned to the top left of the image, see passRows for
+    # mirrored rows.
+    # *******************************************
+    def passSelection(self, rowRange, colRange, step, prevStep, reuse=None, mirror=None):
+        if (step == 1) and (prevStep == 0) and (reuse is None) and (mirror is None):
+            return None
+
+        cols = np.arange(colRange[0], colRange[1])
+        exclusions = []
+        if prevStep > 0:
+            exclusions.append((self.passRows(prevStep, mirror)[rowRange[0]:rowRange[1]], (cols % prevStep) == 0))
+        if reuse is not None:
+            exclusions.append((reuse["rows"][rowRange[0]:rowRange[1]], reuse["cols"][colRange[0]:colRange[1]]))
+        return (self.passRows(step, mirror)[rowRange[0]:rowRange[1]], (cols % step) == 0, exclusions)
+
+    # *******************************************
+    # Fill in the pixels of a box not yet calculated in a progressive pass.
+    # Each pixel takes the value of the grid pixel at the top left of its
+    # block. Later passes overwrite these with calculated values.
+    # *******************************************
+    def fillPreview(self, rowRange, colRange, step):
+        rows = np.arange(rowRange[0], rowRange[1])
+        cols = np.arange(colRange[0], colRange[1])
+        firstRow = ((rowRange[0] + step - 1) // step) * step
+        firstCol = ((colRange[0] + step - 1) // step) * step
+        gridRows = np.maximum((rows // step) * step, firstRow)
+        gridCols = np.maximum((cols // step) * step, firstCol)
+        self.iterations[rowRange[0]:rowRange[1], colRange[0]:colRange[1]] = self.iterations[np.ix_(gridRows, gridCols)]
+
     # *******************************************
     # Method to move an image.
     # Like method to generate whole image except does move first
     # to save time by avoiding recomputation.
+    # Rendered pixels are moved in the frame buffer too, so only the
+    # recalculated boxes need rendering again.
+    # Calls onDone with the list of recalculated boxes when the image is
+    # complete, or None if the whole image was generated.
     # *******************************************
-    def moveImage(self, hMove, vMove):
-        # Inhibit the some menu items during image generation.
-        self.blockMenus(False)
+    def moveImage(self, hMove, vMove, onDone=None):
+        # Can only move a complete image that isn't being generated.
+        # Otherwise generate the whole image, cancelling generation in progress.
+        # Same if the move is the whole image.
+        if ((self.genBusy > 0) or (not self.imageComplete)
+            or (abs(hMove) >= self.imageWidth) or (abs(vMove) >= self.imageHeight)):
+            logger.debug("Image incomplete, generating whole image instead of moving.")
+            self.genImage((0, self.imageHeight), (0, self.imageWidth), True, None if onDone is None else lambda: onDone(None))
+            return
 
         # Start time for image generation timing.
         startTime = datetime.now()
 
-        # Do the moves first.
-        # Then follow up by recalculating the new bits.
-        if hMove < 0:
-            # Centre moved left.
-            for row in range (0, self.imageHeight):
-                for col in range (self.imageWidth - 1, abs(hMove), -1):
-                    self.iterations[row][col] = self.iterations[row][col - abs(hMove)]
-        elif hMove > 0:
-            # Centre moved right.
-            for row in range (0, self.imageHeight):
-                for col in range (0, (self.imageWidth - abs(hMove) - 1)):
-                    self.iterations[row][col] = self.iterations[row][col + abs(hMove)]
-        if vMove < 0:
-            # Centre moved up.
-            for col in range (0, self.imageWidth):
-                for row in range (self.imageHeight - 1, abs(vMove), -1):
-                    self.iterations[row][col] = self.iterations[row - abs(vMove)][col]
-        elif vMove > 0:
-            # Centre moved down.
-            for col in range (0, self.imageWidth):
-                for row in range (0, (self.imageHeight - abs(vMove) - 1)):
-                    self.iterations[row][col] = self.iterations[row + abs(vMove)][col]
+        # Move the rendered image, and show it while the new bits are calculated.
+        shiftPixels(self.framePixels, hMove, vMove)
+        self.frameSurface.mark_dirty()
+        self.gtkPic.queue_draw()
+
+        # Take pixels moved out of the image out of the histogram.
+        # Histogram of the recalculated boxes is added when they are done.
+        hist = None
+        if self.histValid:
+            hist = self.hist.copy()
+            for rowRange, colRange in self.moveBoxes(-hMove, -vMove):
+                hist -= histogramCounts(self.iterations[rowRange[0]:rowRange[1], colRange[0]:colRange[1]], self.maxIterations)
+
+        # Move the existing calculations as a block.
+        # Pixels no longer line up with the last whole image generation,
+        # so they can't be reused or continued from it.
+        shiftPixels(self.iterations, hMove, vMove)
+        self.resumeState = None
+        self.frame = None
 
         # Now that moves of existing calculations have been done,
         # need to regenerate images for missed bits.
+        boxes = self.moveBoxes(hMove, vMove)
+        self.genBoxes(boxes, startTime, onDone, hist)
 
-        # Regenerate the boxes of data moved.
+    # *******************************************
+    # Boxes of pixels exposed by moving the image.
+    # Boxes are exactly the pixels exposed by the move; the columns
+    # exposed by a horizontal move take the corner, so the rows exposed
+    # by a vertical move only need the other columns.
+    # Reversing the move gives the boxes of pixels moved out of the image.
+    # *******************************************
+    def moveBoxes(self, hMove, vMove):
+        boxes = []
+        cols = (0, self.imageWidth)
         if hMove < 0:
-            self.genImage((0, self.imageHeight - 1), (0, abs(hMove) + 1))
+            boxes.append(((0, self.imageHeight), (0, -hMove)))
+            cols = (-hMove, self.imageWidth)
         elif hMove > 0:
-            self.genImage((0, self.imageHeight - 1), (self.imageWidth - abs(hMove) - 1, self.imageWidth - 1))
+            boxes.append(((0, self.imageHeight), (self.imageWidth - hMove, self.imageWidth)))
+            cols = (0, self.imageWidth - hMove)
         if vMove < 0:
-            self.genImage((0, abs(vMove) + 1), (0, self.imageWidth - 1))
+            boxes.append(((0, -vMove), cols))
         elif vMove > 0:
-            self.genImage((self.imageHeight - abs(vMove) - 1, self.imageHeight - 1), (0, self.imageWidth - 1))
+            boxes.append(((self.imageHeight - vMove, self.imageHeight), cols))
+        return boxes
+
+    # *******************************************
+    # Generate a list of boxes of the image, one after the other.
+    # Calls onDone with the boxes when the last box is complete, with the
+    # image generation time since startTime.
+    # Histogram of each box is added to hist if given, which is then the
+    # histogram of the image.
+    # *******************************************
+    def genBoxes(self, boxes, startTime, onDone, hist=None, box=0):
+        if (box > 0) and (hist is not None):
+            hist += self.generation["hist"]
+        if box < len(boxes):
+            self.genImage(boxes[box][0], boxes[box][1], False, lambda: self.genBoxes(boxes, startTime, onDone, hist, box + 1))
+            return
+
+        if hist is not None:
+            self.hist = hist
+            self.histValid = True
+            if ((self.autoHistogram == True) & (self.histogramPresent == True)):
+                self.histogram.plotHistogram()
 
         # End time and image generation elapsed time.
         endTime = datetime.now()
         self.genTime = "{0:s}".format(str(endTime - startTime))
 
-        # Enable menu items inhibited during image generation.
-        self.blockMenus(True)
+        # Moved image is now a whole image that can be reused.
+        self.frame = {
+            "view" : self.viewKey((0, self.imageHeight), (0, self.imageWidth)),
+            "maxIterations" : self.maxIterations
+        }
+
+        if onDone is not None:
+            onDone(boxes)
     
+    # *******************************************
+    # Create the frame buffer the image is rendered into.
+    # Buffer is a cairo image surface of 32 bit pixels (0x00RRGGBB) on top of
+    # a numpy array, so renders are written straight into the pixels that Gtk
+    # draws, with no intermediate copies. Buffer is rebuilt whenever the
+    # picture is (re)initialised, e.g. new image or image size changed by
+    # loading data, and is reused by every render in between.
+    # Initialise buffer to all white.
+    # *******************************************
+    def initFrameBuffer(self):
+        stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_RGB24, self.imageWidth)
+        self.frameData = np.full((self.imageHeight, stride // 4), 0xffffffff, dtype=np.uint32)
+        self.frameSurface = cairo.ImageSurface.create_for_data(memoryview(self.frameData), cairo.FORMAT_RGB24, self.imageWidth, self.imageHeight, stride)
+        self.framePixels = self.frameData[:, :self.imageWidth]
+        self.frameTable = None
+        logger.debug("Created frame buffer, width : {0:d}, height : {1:d}, stride : {2:d}".format(self.imageWidth, self.imageHeight, stride))
+
     # *******************************************
     # Method to render the Mandlebrot image.
     # Renders to current colour mapping.
     # Option exists to render in black without palette.
+    # Whole image is coloured at once from a lookup table, straight into the
+    # frame buffer, and Gtk image redrawn from it.
+    # If boxes (row range, column range) are given only they are rendered,
+    # as long as the rest of the frame buffer was rendered from the same
+    # lookup table; otherwise the whole image is rendered.
     # *******************************************
-    def renderImage(self, black):
-        # Quick look through colour palette boundaries to check for useful boundaries.
-        # Not useful if iteration limits are not increasing.
-        prevBound = -1
-        numBoundaries = len(self.palette.colBoundaries)
-        useFulBoundaries = 0
-        for b in range (0, numBoundaries):
-            thisBound = self.palette.colBoundaries[b].itLimit
-            logger.debug("PREV bound : {0:d}, THIS bound: {1:d}".format(prevBound, thisBound))
-            if prevBound < thisBound:
-                prevBound = thisBound
-                useFulBoundaries += 1
-            else:
-                break
-        logger.debug("Useful colour palette boundaries : {0:d}, total boundaries : {1:d}".format(useFulBoundaries, numBoundaries))
-
-        # Need to put iterations counts into bins for histogram.
-        # This also gets lowest iteration bin used for black renders here.
-        if black:
+    def renderImage(self, black, boxes=None):
+        # Check if rendering in black or using the colour palette.
+        # Note that you can do custom black rendering using the colour palette.
+        if not black:
+            table = self.palette.table(self.maxIterations)
+        else:
+            # Need to put iterations counts into bins for histogram.
+            # This also gets lowest iteration bin used for black renders here.
             self.histogram.doHistogramBins()
-
-        # Set the pixels in the PIL image.
-        for row in range (0, self.imageHeight):
-            for col in range (0, self.imageWidth):
-
-                # Check if rendering in black or using the colour palette.
-                # Don't need to search for colour bands when rendering in black.
-                # Note that you can do custom black rendering using the colour palette.
-                if not black:
-                    # Work out which band the pixel colour falls into.
-                    # Not a band is between colour boundaries.
-                    # Find the first one that matches.
-                    foundBand = False
-                    belowBands = False
-                    aboveBands = False
-                    for b in range (0, useFulBoundaries - 1):
-                        # Check if iterations greater than boundary iteration limit.
-                        if self.iterations[row][col] > self.palette.colBoundaries[b].itLimit :
-                            # Greater than limit; check less than or equal to next boundary limit.
-                            if self.iterations[row][col] <= self.palette.colBoundaries[b+1].itLimit :
-                                foundBand = True
-                                break
-                        else:
-                            if b == 0 :
-                                # Lower than first colour boundary, therefore below first band.
-                                belowBands = True
-                                break
-                    # Check for above last boundary.
-                    if not foundBand:
-                        if self.iterations[row][col] > self.palette.colBoundaries[useFulBoundaries - 1].itLimit :
-                            aboveBands = True
-
-                    # Determine the pixel colour.
-                    # Depends on whether we found iterations in or outside boundaries.
-                    if foundBand:
-                        pxRed, pxGreen, pxBlue = getColInRange(self.iterations[row][col], self.palette.colBoundaries[b], self.palette.colBoundaries[b+1])
-                    elif belowBands:
-                        pxRed = self.palette.colBoundaries[0].colRed
-                        pxGreen = self.palette.colBoundaries[0].colGreen
-                        pxBlue = self.palette.colBoundaries[0].colBlue
-                    elif aboveBands:
-                        pxRed = self.palette.colBoundaries[useFulBoundaries - 1].colRed
-                        pxGreen = self.palette.colBoundaries[useFulBoundaries - 1].colGreen
-                        pxBlue = self.palette.colBoundaries[useFulBoundaries - 1].colBlue
-                else:
-                    # Option to render just in black (and shades there of) selected.
-                    # Don't need to check colour palette.
-                    intensity = math.floor((self.iterations[row][col] - self.lowBin) / (self.maxIterations - self.lowBin) * 255)
-                    pxRed = intensity
-                    pxGreen = intensity
-                    pxBlue = intensity
-
-                # Update the image pixel colour.
-                self.pilPic.putpixel((col, row), (pxRed, pxGreen, pxBlue))
-
-        # Get the pixel data from the PIL image and update Gtk pixel buffer and Gtk Image.
-        data = GLib.Bytes.new(self.pilPic.tobytes())
-        pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(data, GdkPixbuf.Colorspace.RGB, False, self.imageColours, self.imageWidth, self.imageHeight, self.imageWidth * 3)
-        self.gtkPic.set_from_pixbuf(pixbuf)
+            table = greyTable(self.lowBin, self.maxIterations, self.paletteTableSize)
+        table = packTable(table)
+
+        # Black renders are scaled from the lowest histogram bin, which can
+        # change with only some pixels, so check table is still the same.
+        if (boxes is not None) and (self.frameTable is not None) and np.array_equal(table, self.frameTable):
+            for rowRange, colRange in boxes:
+                rows = slice(rowRange[0], rowRange[1])
+                cols = slice(colRange[0], colRange[1])
+                renderTable(self.iterations[rows, cols], table, self.maxIterations, self.framePixels[rows, cols])
+
+            # Tell cairo the pixels have changed and redraw just the boxes of the Gtk Image.
+            self.frameSurface.mark_dirty()
+            for rowRange, colRange in boxes:
+                self.gtkPic.queue_draw_area(self.imageStartX + colRange[0], self.imageStartY + rowRange[0],
+                    colRange[1] - colRange[0], rowRange[1] - rowRange[0])
+            logger.debug("Rendered image boxes : {0:d}".format(len(boxes)))
+        else:
+            renderTable(self.iterations, table, self.maxIterations, self.framePixels)
+
+            # Tell cairo the pixels have changed and redraw the Gtk Image.
+            self.frameSurface.mark_dirty()
+            self.gtkPic.queue_draw()
+        self.frameTable = table
 
 # *******************************************
 # Create main window, and launch.
@@ -1117,3 +1758,12 @@ win = builder.get_object("mainWindow")
 mandle = Mandelbrot(win)
 win.show_all()
 Gtk.main()
+
+# Keep the tiles done of any image generation in progress.
+# Stop any image generation in progress.
+# Shut down calculation worker processes and release shared memory.
+mandle.closeCheckpoint()
+mandle.cancelImage()
+mandle.scheduler.shutdown()
+mandle.iterBuffer.close()
+mandle.refOrbit.close()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import argparse
+import json
+import os
+import queue
+import sys
+from collections import deque
+from datetime import datetime
+
+from chaosRender import *
+
+# *******************************************
+# Batch rendering of many views, without the GUI.
+# Jobs are read from a JSON file (list of jobs, or dictionary with a list
+# of "jobs") or JSON lines file (job per line). Each job is a dictionary of:
+#   "id" - job name, defaults to the job's position in the file.
+#   "real", "imag" - image centre (decimal strings).
+#   "pxSize", "width", "height" - pixel size and image size.
+#   "maxIterations" - maximum iterations, or list to render at each.
+#   "palette" - colour palette file, default palette if not given.
+#   "black" - render in black instead of the colour palette.
+#   "png", "dat" - files to write, formatted with the job, e.g. "{id}_{maxIterations}.png".
+#   "quantise" - write image data quantised, 3 bytes per pixel.
+# Missing view settings default as for chaosRender.
+# Tiles of a number of jobs are calculated on the process pool at the same
+# time, so small jobs run in parallel and large jobs are split across the pool.
+# Each finished job is recorded in a results manifest (JSON lines), and
+# jobs already in the manifest are skipped, so a killed run can be resumed.
+# *******************************************
+
+# *******************************************
+# Read jobs from job file.
+# Jobs with a list of maximum iterations are expanded into a job for each.
+# Returns list of jobs.
+# *******************************************
+def loadJobs(fname):
+    with open(fname) as jobFile:
+        text = jobFile.read()
+    try:
+        jobs = json.loads(text)
+        if isinstance(jobs, dict):
+            jobs = jobs["jobs"]
+    except json.JSONDecodeError:
+        jobs = [json.loads(line) for line in text.splitlines() if line.strip() != ""]
+
+    expanded = []
+    for index, job in enumerate(jobs):
+        job = dict(job)
+        job.setdefault("id", "job{0:d}".format(index))
+        limits = job.get("maxIterations")
+        if isinstance(limits, list):
+            for limit in limits:
+                expanded.append(dict(job, maxIterations=limit, id="{0:s}_{1:d}".format(str(job["id"]), limit)))
+        else:
+            expanded.append(job)
+    return expanded
+
+# *******************************************
+# Read ids of jobs already done from results manifest.
+# *******************************************
+def doneJobs(fname):
+    done = set()
+    if os.path.exists(fname):
+        with open(fname) as manifest:
+            for line in manifest:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line may be incomplete if the run was killed.
+                    continue
+                if result.get("status") == "done":
+                    done.add(result["id"])
+    return done
+
+# *******************************************
+# Batch runner class.
+# Keeps the process pool busy with the tiles of as many jobs as needed,
+# finishing each job (colouring, writing files) as its last tile is done.
+# *******************************************
+class batchRunner():
+    # Initializer / Instance Attributes
+    def __init__(self, config, logger, scheduler, manifest):
+
+        self.config = config
+        self.logger = logger
+        self.scheduler = scheduler
+        self.manifest = manifest
+
+        # Tiles waiting or being calculated on the pool.
+        # Enough to keep all workers busy between jobs.
+        self.maxTiles = 2 * scheduler.workers
+        self.tiles = 0
+
+        # Tile results, reported from pool threads.
+        self.results = queue.Queue()
+
+        # Jobs started and not yet finished, by number of jobs started before.
+        self.active = {}
+        self.started = 0
+
+    # *******************************************
+    # Run list of jobs.
+    # Returns number of jobs that failed.
+    # *******************************************
+    def run(self, jobs):
+        pending = deque(jobs)
+        failed = 0
+        while (len(pending) > 0) or (len(self.active) > 0):
+            # Start jobs while there is room on the pool.
+            while (len(pending) > 0) and (self.tiles < self.maxTiles):
+                if not self.startJob(pending.popleft()):
+                    failed += 1
+            if len(self.active) == 0:
+                continue
+
+            # Wait for a tile, and finish its job if it was the last.
+            key, future = self.results.get()
+            self.tiles -= 1
+            active = self.active[key]
+            active["tiles"] -= 1
+            if future.exception() is not None:
+                active["error"] = str(future.exception())
+            else:
+                active["render"].tileDone(future.result())
+            if active["tiles"] == 0:
+                if not self.finishJob(self.active.pop(key)):
+                    failed += 1
+        return failed
+
+    # *******************************************
+    # Start calculating a job's tiles on the pool.
+    # Returns False if the job couldn't be started.
+    # *******************************************
+    def startJob(self, job):
+        try:
+            centreReal, centreImag, pxSize, width, height, maxIterations = viewSettings(self.config, job.get("real"), job.get("imag"),
+                job.get("pxSize"), job.get("width"), job.get("height"), job.get("maxIterations"))
+            boundaries = loadPalette(job["palette"]) if job.get("palette") is not None else defaultPalette(maxIterations)
+            render = viewRender(self.config, self.logger, self.scheduler, centreReal, centreImag, pxSize, width, height, maxIterations)
+        except Exception as e:
+            self.record(job, "failed", error=str(e))
+            return False
+
+        tileJobs = render.tileJobs()
+        key = self.started
+        self.started += 1
+        self.active[key] = {"job" : job, "render" : render, "boundaries" : boundaries,
+            "tiles" : len(tileJobs), "error" : None, "startTime" : datetime.now()}
+        self.tiles += len(tileJobs)
+        self.scheduler.submit(tileJobs, lambda future: self.results.put((key, future)))
+        self.logger.debug("Started job : {0:s}, tiles : {1:d}".format(str(job["id"]), len(tileJobs)))
+        return True
+
+    # *******************************************
+    # Job's tiles all done; colour it and write its files.
+    # Returns False if the job failed.
+    # *******************************************
+    def finishJob(self, active):
+        job = active["job"]
+        render = active["render"]
+        try:
+            if active["error"] is not None:
+                raise RuntimeError(active["error"])
+            fields = dict(job, maxIterations=render.maxIterations)
+            outputs = []
+            if job.get("png") is not None:
+                outputs.append(job["png"].format(**fields))
+                writePng(outputs[-1], render.colourImage(active["boundaries"], job.get("black", False)))
+            if job.get("dat") is not None:
+                outputs.append(job["dat"].format(**fields))
+                render.saveData(outputs[-1], job.get("quantise", False))
+        except Exception as e:
+            self.record(job, "failed", error=str(e))
+            return False
+        finally:
+            render.close()
+
+        seconds = (datetime.now() - active["startTime"]).total_seconds()
+        pixels = render.imageWidth * render.imageHeight
+        self.record(job, "done", outputs=outputs, pixels=pixels, maxIterations=render.maxIterations,
+            seconds=round(seconds, 3), pixelsPerSecond=round(pixels / max(seconds, 1e-9)))
+        return True
+
+    # *******************************************
+    # Record job result in the manifest.
+    # Written straight to disk, so that it survives the run being killed.
+    # *******************************************
+    def record(self, job, status, **details):
+        result = dict({"id" : job["id"], "status" : status, "finished" : datetime.now().isoformat(timespec='seconds')}, **details)
+        self.manifest.write(json.dumps(result) + "\n")
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+        if status == "done":
+            self.logger.info("Job done : {0:s}, {1:.3f} s, {2:d} pixels/s".format(str(job["id"]), result["seconds"], result["pixelsPerSecond"]))
+        else:
+            self.logger.error("Job failed : {0:s}, {1:s}".format(str(job["id"]), result.get("error", "")))
+
+# *******************************************
+# Command line arguments.
+# *******************************************
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Render a batch of Mandelbrot images without the GUI.")
+    parser.add_argument("jobs", help="Job file (JSON or JSON lines).")
+    parser.add_argument("--manifest", default=None, help="Results manifest file, default job file name with .results.jsonl.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, 0 for all cores.")
+    parser.add_argument("--config", default="chaos.json", help="Configuration file.")
+    parser.add_argument("--verbose", action="store_true", help="Log debug messages to stderr.")
+    return parser.parse_args(argv)
+
+# *******************************************
+# Run batch of jobs given on the command line, skipping jobs already done.
+# *******************************************
+def main(argv):
+    args = parseArgs(argv)
+    try:
+        config = loadConfig(args.config)
+    except Exception:
+        print("Failed to open configuration file : {0:s}".format(args.config), file=sys.stderr)
+        return -1
+    logger = makeLogger(args.verbose)
+
+    jobs = loadJobs(args.jobs)
+    manifestName = args.manifest if args.manifest is not None else os.path.splitext(args.jobs)[0] + ".results.jsonl"
+    done = doneJobs(manifestName)
+    todo = [job for job in jobs if job["id"] not in done]
+    print("Jobs : {0:d}, already done : {1:d}, to do : {2:d}".format(len(jobs), len(jobs) - len(todo), len(todo)))
+
+    calc = config["Calculations"]
+    startTime = datetime.now()
+    scheduler = tileScheduler(logger, args.workers if args.workers is not None else calc["Workers"], calc["TileSize"])
+    try:
+        with open(manifestName, 'a') as manifest:
+            failed = batchRunner(config, logger, scheduler, manifest).run(todo)
+    finally:
+        scheduler.shutdown()
+
+    seconds = (datetime.now() - startTime).total_seconds()
+    print("Jobs done : {0:d}, failed : {1:d}, in {2:.3f} s ({3:d} workers)".format(len(todo) - failed, failed, seconds, scheduler.workers))
+    return 0 if failed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
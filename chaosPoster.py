@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import math
+import sys
+from datetime import datetime
+
+from chaosRender import *
+
+# *******************************************
+# Poster rendering of very large Mandelbrot images, without the GUI.
+# Image is calculated a band of rows at a time, each band coloured and
+# written straight to the PNG and / or image data file, then discarded,
+# so memory used depends on the band size and not the image size.
+# One render of the whole view is used for all bands, so the reference
+# orbit for deep zooms is only calculated once.
+# Black renders need the lowest histogram bin of the whole image before
+# the first band is coloured, so it is found from a low resolution
+# render of the whole view first.
+# *******************************************
+
+# *******************************************
+# Lowest histogram bin used, from a low resolution render of the view.
+# Low resolution view is at most size pixels along its longest side.
+# *******************************************
+def prepassLowBin(config, logger, scheduler, centreReal, centreImag, pxSize, width, height, maxIterations, size):
+    factor = max(1, math.ceil(max(width, height) / size))
+    render = viewRender(config, logger, scheduler, centreReal, centreImag, pxSize * factor,
+        max(1, width // factor), max(1, height // factor), maxIterations)
+    try:
+        render.calculate()
+        lowBin = render.lowBin()
+    finally:
+        render.close()
+    logger.debug("Low resolution pre-pass, factor : {0:d}, lowest bin : {1:d}".format(factor, lowBin))
+    return lowBin
+
+# *******************************************
+# Command line arguments.
+# *******************************************
+def parseArgs(argv):
+    parser = viewArgParser("Render a very large Mandelbrot image a band at a time without the GUI.")
+    parser.add_argument("--band", type=int, default=256, help="Rows in each band.")
+    parser.add_argument("--prepass", type=int, default=512, help="Longest side of low resolution pre-pass for black renders.")
+    args = parser.parse_args(argv)
+    if (args.png is None) and (args.dat is None):
+        parser.error("nothing to do, give --png and / or --dat.")
+    return args
+
+# *******************************************
+# Render poster given on the command line.
+# *******************************************
+def main(argv):
+    args = parseArgs(argv)
+    try:
+        config = loadConfig(args.config)
+    except Exception:
+        print("Failed to open configuration file : {0:s}".format(args.config), file=sys.stderr)
+        return -1
+    logger = makeLogger(args.verbose)
+
+    calc = config["Calculations"]
+    centreReal, centreImag, pxSize, width, height, maxIterations = viewSettings(config, args.real, args.imag, args.pxsize, args.width, args.height, args.iterations)
+    boundaries = loadPalette(args.palette) if args.palette is not None else defaultPalette(maxIterations)
+    imageScale = calc["DefScale"] * calc["DefPixelSize"] / pxSize
+
+    startTime = datetime.now()
+    scheduler = tileScheduler(logger, args.workers if args.workers is not None else calc["Workers"], calc["TileSize"])
+    png = None
+    dat = None
+    try:
+        # Colour lookup table for all bands.
+        if not args.black:
+            table = paletteTable(boundaries, maxIterations, config["Colours"]["paletteTableSize"])
+        else:
+            lowBin = prepassLowBin(config, logger, scheduler, centreReal, centreImag, pxSize, width, height, maxIterations, args.prepass)
+            table = greyTable(lowBin, maxIterations, config["Colours"]["paletteTableSize"])
+
+        if args.png is not None:
+            png = pngWriter(args.png, width, height)
+        if args.dat is not None:
+            if args.quantise and (maxIterations > quantiseLimit):
+                logger.warning("Maximum iterations above {0:d}, image data written unquantised : {1:s}".format(quantiseLimit, args.dat))
+            dat = open(args.dat, 'wb')
+            datType = writeIterationHeader(dat, width, height, maxIterations, centreReal, centreImag, pxSize, imageScale, args.quantise)
+
+        render = viewRender(config, logger, scheduler, centreReal, centreImag, pxSize, width, height, maxIterations, args.band)
+        try:
+            rgb = np.empty((render.iterBuffer.height, width, 3), dtype=np.uint8)
+            for start in range (0, height, args.band):
+                rowRange = (start, min(start + args.band, height))
+                band = render.calculateBand(rowRange)
+                if png is not None:
+                    renderTable(band, table, maxIterations, rgb[:band.shape[0]])
+                    png.writeRows(rgb[:band.shape[0]])
+                if dat is not None:
+                    writeIterationRows(dat, band, datType)
+                logger.debug("Band done, rows : ({0:d}, {1:d})".format(rowRange[0], rowRange[1]))
+        finally:
+            render.close()
+
+        if png is not None:
+            png.close()
+            png = None
+    finally:
+        scheduler.shutdown()
+        if png is not None:
+            png.file.close()
+        if dat is not None:
+            dat.close()
+
+    seconds = (datetime.now() - startTime).total_seconds()
+    print("Rendered {0:d} x {1:d} in {2:.3f} s ({3:.0f} pixels/s, {4:d} workers)".format(width, height, seconds, (width * height) / max(seconds, 1e-9), scheduler.workers))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import argparse
+import json
+import math
+import sys
+import time
+import numpy as np
+from datetime import datetime
+from decimal import Decimal
+
+from imageCalc import *
+from imageRender import *
+from tileScheduler import *
+from pngWriter import *
+from checkpoint import *
+from viewCalc import *
+
+# *******************************************
+# Headless rendering of Mandelbrot images, without Gtk or matplotlib.
+# Calculates a view on the tile scheduler process pool, as the GUI does,
+# and writes the image to PNG and / or image data (.dat) files.
+# Renders are checkpointed next to the output file as they go, so that a
+# render that was stopped can be resumed, see renderCheckpoint.
+# *******************************************
+
+# *******************************************
+# Load configuration file.
+# Calculation settings are the same as for the GUI.
+# *******************************************
+def loadConfig(fname):
+    with open(fname) as config_file:
+        return json.load(config_file)
+
+# *******************************************
+# Default colour palette, as for colourPalette.
+# Returns list of (iteration limit, red, green, blue) boundaries.
+# *******************************************
+def defaultPalette(maxIterations):
+    return [(1, 0, 0, 200), (math.floor(maxIterations * 0.20) - 1, 0, 0, 50), (math.floor(maxIterations * 0.80), 150, 150, 150), (maxIterations, 0, 0, 0)]
+
+# *******************************************
+# Load colour palette file, as saved by colourPalette.saveToFile.
+# Returns list of (iteration limit, red, green, blue) boundaries.
+# *******************************************
+def loadPalette(fname):
+    with open(fname) as cb_file:
+        cb = json.load(cb_file)
+    return [(b['itLimit'], b['colRed'], b['colGreen'], b['colBlue']) for b in cb["colBoundaries"]]
+
+# *******************************************
+# View settings, defaulting to the configuration file defaults as for File/New.
+# Centre is given as decimal strings.
+# Returns centre (decimal), pixel size, width, height and maximum iterations.
+# *******************************************
+def viewSettings(config, real=None, imag=None, pxSize=None, width=None, height=None, maxIterations=None):
+    calc = config["Calculations"]
+    return (Decimal(str(real) if real is not None else repr(calc["DefCentreReal"])),
+        Decimal(str(imag) if imag is not None else repr(calc["DefCentreImag"])),
+        float(pxSize) if pxSize is not None else calc["DefPixelSize"],
+        int(width) if width is not None else config["Image"]["imageWidth"],
+        int(height) if height is not None else config["Image"]["imageHeight"],
+        int(maxIterations) if maxIterations is not None else calc["DefMaxIterations"])
+
+# *******************************************
+# Write RGB image to PNG file.
+# *******************************************
+def writePng(fname, rgb):
+    png = pngWriter(fname, rgb.shape[1], rgb.shape[0])
+    png.writeRows(rgb)
+    png.close()
+
+# *******************************************
+# View render class.
+# Calculates the iterations of a view into an iteration buffer, using the
+# same tile jobs as the GUI image generation, and colours them.
+# If a band height is given, the buffer only holds a band of that many rows
+# and the view is calculated a band at a time, see calculateBand.
+# *******************************************
+class viewRender(viewCalc):
+    # Initializer / Instance Attributes
+    def __init__(self, config, logger, scheduler, centreReal, centreImag, pxSize, width, height, maxIterations, bandHeight=None):
+
+        self.logger = logger
+        self.scheduler = scheduler
+
+        # View.
+        self.centreReal = centreReal
+        self.centreImag = centreImag
+        self.pxSize = pxSize
+        self.imageWidth = width
+        self.imageHeight = height
+        self.maxIterations = maxIterations
+
+        # Image scale relative to the default view, as for the GUI.
+        self.imageScale = config["Calculations"]["DefScale"] * config["Calculations"]["DefPixelSize"] / pxSize
+
+        # Calculation settings, as for the GUI.
+        self.initCalc(config, logger)
+        self.paletteTableSize = config["Colours"]["paletteTableSize"]
+
+        # Iteration values, written directly by the worker processes.
+        self.iterBuffer = iterationBuffer(logger, width, height if bandHeight is None else min(bandHeight, height))
+        self.iterations = self.iterBuffer.data
+
+        # Histogram of iterations, from the tiles calculated.
+        self.hist = np.zeros(maxIterations, dtype=np.int64)
+        self.stats = {}
+
+    # *******************************************
+    # Tile jobs to calculate the view.
+    # Tiles are (row range, column range) boxes; all of the view if not given.
+    # *******************************************
+    def tileJobs(self, tiles=None):
+        if tiles is None:
+            tiles = self.scheduler.splitBox((0, self.imageHeight), (0, self.imageWidth))
+
+        # Get the reference orbit for deep zooms.
+        if self.deepZoom() and (self.refOrbit.shm is None):
+            self.updateReference()
+
+        # Tiles are calculated whole, and put into histogram bins.
+        return [self.tileJob(t[0], t[1], histRows=np.ones(t[0][1] - t[0][0], dtype=bool)) for t in tiles]
+
+    # *******************************************
+    # Combine the result of a tile calculation, see calcTile.
+    # *******************************************
+    def tileDone(self, result):
+        tileRows, tileCols, tileStats, tileState, tileHist = result
+        for key, value in tileStats.items():
+            self.stats[key] = self.stats.get(key, 0) + value
+        self.hist += tileHist
+
+    # *******************************************
+    # Calculate tiles of the view on the process pool.
+    # Tiles as for tileJobs. Waits for the tiles to be done.
+    # If a checkpoint is given, tiles are marked done in it as they finish
+    # and it is written when due, and if the render is interrupted.
+    # *******************************************
+    def calculate(self, tiles=None, checkpoint=None):
+        jobs = self.tileJobs(tiles)
+        if checkpoint is None:
+            for result in self.scheduler.run(jobs):
+                self.tileDone(result)
+        else:
+            try:
+                for result in self.scheduler.results(jobs):
+                    self.tileDone(result)
+                    checkpoint.tileDone(result[0], result[1])
+                    if checkpoint.due():
+                        checkpoint.write(self.iterations)
+            except KeyboardInterrupt:
+                # Keep the tiles done so far.
+                checkpoint.write(self.iterations)
+                raise
+        self.logger.debug("Calculated tiles : {0:d}".format(len(jobs)))
+
+    # *******************************************
+    # Calculate a band of rows of the view, into the band buffer.
+    # Reference orbit and buffer are the same for all bands.
+    # Returns array of the band rows by columns.
+    # *******************************************
+    def calculateBand(self, rowRange):
+        self.iterBuffer.firstRow = rowRange[0]
+        self.calculate(self.scheduler.splitBox(rowRange, (0, self.imageWidth)))
+        return self.iterations[:rowRange[1] - rowRange[0]]
+
+    # *******************************************
+    # Restore the done tiles of a checkpoint of this view.
+    # Histogram is that of the done tiles.
+    # Returns the tiles still to calculate.
+    # *******************************************
+    def restore(self, checkpoint, iterations):
+        self.iterations[...] = iterations
+        self.hist = histogramCounts(self.iterations[checkpoint.doneMask()], self.maxIterations)
+        return checkpoint.missingTiles()
+
+    # *******************************************
+    # Lowest histogram bin used, for black renders.
+    # *******************************************
+    def lowBin(self):
+        used = np.flatnonzero(self.hist)
+        return int(used[0]) if used.size > 0 else self.maxIterations - 1
+
+    # *******************************************
+    # Colour the image, from a palette or in black.
+    # Returns array of rows by columns by 3 (RGB) bytes.
+    # *******************************************
+    def colourImage(self, boundaries, black):
+        if not black:
+            table = paletteTable(boundaries, self.maxIterations, self.paletteTableSize)
+        else:
+            table = greyTable(self.lowBin(), self.maxIterations, self.paletteTableSize)
+        rgb = np.empty((self.imageHeight, self.imageWidth, 3), dtype=np.uint8)
+        renderTable(self.iterations, table, self.maxIterations, rgb)
+        return rgb
+
+    # *******************************************
+    # Write image data file, as for the GUI.
+    # Values are quantised if asked for, see storageType.
+    # *******************************************
+    def saveData(self, fname, quantised=False):
+        if quantised and (self.maxIterations > quantiseLimit):
+            self.logger.warning("Maximum iterations above {0:d}, image data written unquantised : {1:s}".format(quantiseLimit, fname))
+        writeIterationData(fname, self.iterations, self.maxIterations, self.centreReal, self.centreImag, self.pxSize, self.imageScale, quantised)
+
+    # *******************************************
+    # Release the shared memory blocks.
+    # *******************************************
+    def close(self):
+        self.refOrbit.close()
+        self.iterBuffer.close()
+
+# *******************************************
+# Command line arguments for rendering a view.
+# *******************************************
+def viewArgParser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--real", default=None, help="Real part of image centre (decimal string).")
+    parser.add_argument("--imag", default=None, help="Imaginary part of image centre (decimal string).")
+    parser.add_argument("--pxsize", type=float, default=None, help="Pixel size.")
+    parser.add_argument("--width", type=int, default=None, help="Image width in pixels.")
+    parser.add_argument("--height", type=int, default=None, help="Image height in pixels.")
+    parser.add_argument("--iterations", type=int, default=None, help="Maximum iterations.")
+    parser.add_argument("--palette", default=None, help="Colour palette file (JSON), default palette if not given.")
+    parser.add_argument("--black", action="store_true", help="Render in black instead of the colour palette.")
+    parser.add_argument("--png", default=None, help="PNG image file to write.")
+    parser.add_argument("--dat", default=None, help="Image data file to write.")
+    parser.add_argument("--quantise", action="store_true", help="Write image data quantised, 3 bytes per pixel (maximum iterations up to 65535).")
+    parser.add_argument("--resume", action="store_true", help="Resume render from its checkpoint, view is taken from the checkpoint.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, 0 for all cores.")
+    parser.add_argument("--config", default="chaos.json", help="Configuration file.")
+    parser.add_argument("--verbose", action="store_true", help="Log debug messages to stderr.")
+    return parser
+
+# *******************************************
+# Command line arguments.
+# *******************************************
+def parseArgs(argv):
+    parser = viewArgParser("Render a Mandelbrot image without the GUI.")
+    args = parser.parse_args(argv)
+    if (args.png is None) and (args.dat is None):
+        parser.error("nothing to do, give --png and / or --dat.")
+    return args
+
+# *******************************************
+# Create logger, logging to stderr.
+# *******************************************
+def makeLogger(verbose):
+    logger = logging.getLogger('chaosRender')
+    logger.setLevel(logging.DEBUG if verbose else logging.WARNING)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt='%(asctime)s.%(msecs)03d [%(name)s] [%(levelname)-8s] %(message)s', datefmt='%Y%m%d-%H:%M:%S', style='%'))
+    logging.Formatter.converter = time.localtime
+    logger.addHandler(handler)
+    return logger
+
+# *******************************************
+# Render view given on the command line.
+# View defaults to the configuration file defaults, as for File/New.
+# Render is checkpointed next to the image data file (or PNG file if
+# none), and the checkpoint removed once the files are written.
+# *******************************************
+def main(argv):
+    args = parseArgs(argv)
+    try:
+        config = loadConfig(args.config)
+    except Exception:
+        print("Failed to open configuration file : {0:s}".format(args.config), file=sys.stderr)
+        return -1
+    logger = makeLogger(args.verbose)
+
+    calc = config["Calculations"]
+    checkpointFile = checkpointName(args.dat if args.dat is not None else args.png)
+    checkpoint = None
+    if args.resume:
+        try:
+            checkpoint, iterations = readCheckpoint(logger, checkpointFile, calc["CheckpointInterval"])
+        except Exception as e:
+            print("Failed to read checkpoint file : {0:s} ({1:s})".format(checkpointFile, str(e)), file=sys.stderr)
+            return -1
+        view = checkpoint.view
+        args.real, args.imag, args.pxsize = view["centreReal"], view["centreImag"], view["pxSize"]
+        args.width, args.height, args.iterations = view["imageWidth"], view["imageHeight"], view["maxIterations"]
+    centreReal, centreImag, pxSize, width, height, maxIterations = viewSettings(config, args.real, args.imag, args.pxsize, args.width, args.height, args.iterations)
+    boundaries = loadPalette(args.palette) if args.palette is not None else defaultPalette(maxIterations)
+
+    startTime = datetime.now()
+    scheduler = tileScheduler(logger, args.workers if args.workers is not None else calc["Workers"], calc["TileSize"])
+    render = viewRender(config, logger, scheduler, centreReal, centreImag, pxSize, width, height, maxIterations)
+    try:
+        tiles = None
+        if checkpoint is not None:
+            tiles = render.restore(checkpoint, iterations)
+            print("Resuming render, tiles to calculate : {0:d} of {1:d}".format(len(tiles), checkpoint.done.size))
+        else:
+            checkpoint = renderCheckpoint(logger, checkpointFile, render.checkpointView(), scheduler.tileSize, calc["CheckpointInterval"])
+        render.calculate(tiles, checkpoint)
+        if args.png is not None:
+            writePng(args.png, render.colourImage(boundaries, args.black))
+        if args.dat is not None:
+            render.saveData(args.dat, args.quantise)
+        checkpoint.remove()
+    finally:
+        scheduler.shutdown()
+        render.close()
+
+    seconds = (datetime.now() - startTime).total_seconds()
+    print("Rendered {0:d} x {1:d} in {2:.3f} s ({3:.0f} pixels/s, {4:d} workers)".format(width, height, seconds, (width * height) / max(seconds, 1e-9), scheduler.workers))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import hashlib
+import json
+import math
+import os
+import time
+import numpy as np
+
+from iterBuffer import *
+
+# Checkpoint file format version, written with the view.
+checkpointVersion = 1
+
+# Least time between checkpoints, as a multiple of the time the last
+# checkpoint took to write, so writing them stays a small part of the
+# render time however big the image is.
+checkpointRatio = 50
+
+# *******************************************
+# Name of the checkpoint file for an output file.
+# Checkpoint is written next to the output file.
+# *******************************************
+def checkpointName(fname):
+    return fname + ".ckpt"
+
+# *******************************************
+# Name of the checkpoint file for a view, in a directory.
+# Used when there is no output file yet (e.g. in the GUI). Named from a
+# hash of the view, so checkpoints of different views don't overwrite
+# each other.
+# *******************************************
+def viewCheckpointName(directory, view):
+    digest = hashlib.sha1(json.dumps(view, sort_keys=True).encode()).hexdigest()
+    return os.path.join(directory, "chaos-{0:s}.ckpt".format(digest[:12]))
+
+# *******************************************
+# Render checkpoint class.
+# Records which tiles of an image render are done, so that a render that
+# was stopped can be resumed by calculating only the tiles not done.
+# Tiles are the squares of a grid of tile size aligned to the top left of
+# the image, as split by the tile scheduler.
+# Checkpoint file (numpy .npz) holds the view, the done tile bitmap and
+# the iteration values, of which only those of done tiles are valid.
+# View is a dictionary of centre (decimal strings), pixel size, image
+# scale, image size and maximum iterations.
+# *******************************************
+class renderCheckpoint():
+    # Initializer / Instance Attributes
+    def __init__(self, logger, fname, view, tileSize, interval):
+
+        self.logger = logger
+        self.fname = fname
+        self.view = view
+        self.tileSize = tileSize
+
+        # Seconds between checkpoints, 0 for none.
+        self.interval = interval
+
+        # Done tiles, by tile row and column.
+        self.done = np.zeros((math.ceil(view["imageHeight"] / tileSize), math.ceil(view["imageWidth"] / tileSize)), dtype=bool)
+
+        # Time of the last checkpoint (or start), and how long it took to write.
+        self.lastWrite = time.monotonic()
+        self.writeSeconds = 0.0
+
+        # Set once the checkpoint file holds this render.
+        self.written = False
+
+    # *******************************************
+    # Mark tile done. Ranges as for the tile scheduler.
+    # *******************************************
+    def tileDone(self, rowRange, colRange):
+        ts = self.tileSize
+        self.done[rowRange[0] // ts:(rowRange[1] + ts - 1) // ts, colRange[0] // ts:(colRange[1] + ts - 1) // ts] = True
+
+    # *******************************************
+    # Tiles not done yet.
+    # Returns list of (row range, column range) tiles.
+    # *******************************************
+    def missingTiles(self):
+        ts = self.tileSize
+        height = self.view["imageHeight"]
+        width = self.view["imageWidth"]
+        return [((r * ts, min((r + 1) * ts, height)), (c * ts, min((c + 1) * ts, width))) for r, c in zip(*np.nonzero(~self.done))]
+
+    # *******************************************
+    # Pixels of done tiles.
+    # Returns boolean array of rows by columns, or of done given instead.
+    # *******************************************
+    def doneMask(self, done=None):
+        if done is None:
+            done = self.done
+        ts = self.tileSize
+        rows = done.repeat(ts, axis=0)[:self.view["imageHeight"]]
+        return rows.repeat(ts, axis=1)[:, :self.view["imageWidth"]]
+
+    # *******************************************
+    # Check if it is time to write a checkpoint.
+    # *******************************************
+    def due(self):
+        if self.interval <= 0:
+            return False
+        return (time.monotonic() - self.lastWrite) >= max(self.interval, checkpointRatio * self.writeSeconds)
+
+    # *******************************************
+    # Write checkpoint file.
+    # Done tiles can be given instead of those marked done, e.g. if some
+    # pixels of the tiles marked done aren't filled in yet.
+    # File is written in full and then renamed, so a checkpoint is never
+    # left half written.
+    # *******************************************
+    def write(self, iterations, done=None):
+        startTime = time.monotonic()
+        if done is None:
+            done = self.done
+        view = dict(self.view, version=checkpointVersion, tileSize=self.tileSize)
+
+        tmpName = self.fname + ".tmp"
+        with open(tmpName, 'wb') as cf:
+            np.savez(cf, view=np.array(json.dumps(view)), done=done, iterations=iterations.astype(iterationType, copy=False))
+            cf.flush()
+            os.fsync(cf.fileno())
+        os.replace(tmpName, self.fname)
+        self.written = True
+
+        self.lastWrite = time.monotonic()
+        self.writeSeconds = self.lastWrite - startTime
+        self.logger.debug("Checkpoint written : {0:s}, tiles done : {1:d} of {2:d}, in {3:.3f} s".format(
+            self.fname, int(done.sum()), done.size, self.writeSeconds))
+
+    # *******************************************
+    # Remove checkpoint file, when the render is complete and saved.
+    # *******************************************
+    def remove(self):
+        if os.path.exists(self.fname):
+            os.remove(self.fname)
+            self.logger.debug("Checkpoint removed : {0:s}".format(self.fname))
+        self.written = False
+
+# *******************************************
+# Read checkpoint file.
+# Checkpoint carries on being written to the same file at the interval.
+# Returns the checkpoint and its iteration values.
+# *******************************************
+def readCheckpoint(logger, fname, interval):
+    with np.load(fname) as cf:
+        view = json.loads(str(cf["view"]))
+        if view.get("version") != checkpointVersion:
+            raise ValueError("Checkpoint version {0:s} not supported : {1:s}".format(str(view.get("version")), fname))
+        tileSize = view.pop("tileSize")
+        view.pop("version")
+
+        checkpoint = renderCheckpoint(logger, fname, view, tileSize, interval)
+        done = cf["done"]
+        iterations = cf["iterations"]
+    if (done.shape != checkpoint.done.shape) or (iterations.shape != (view["imageHeight"], view["imageWidth"])):
+        raise ValueError("Checkpoint data doesn't match image size : {0:s}".format(fname))
+    checkpoint.done[...] = done
+    checkpoint.written = True
+    logger.debug("Checkpoint read : {0:s}, tiles done : {1:d} of {2:d}".format(fname, int(done.sum()), done.size))
+    return checkpoint, iterations
@@ -8,6 +8,7 @@ import json
 
 from utils import *
 from colourBoundary import *
+from imageRender import *
 
 # *******************************************
 # Classes needs Gtk version 3.0.
@@ -38,6 +39,10 @@ class colourPalette():
         self.builder = builder
         self.chaos = chaos
 
+        # Colour lookup table for rendering, and the palette it is for.
+        self.colTable = None
+        self.tableKey = None
+
         # Define colour boundaries
         self.colBoundaries = []
         for i in range (0, self.config["Colours"]["maxBoundries"]):
@@ -62,6 +67,18 @@ class colourPalette():
         self.logger.debug("Updated colour boundary : {0:d}, iterations : {1:d}, red : {2:d}, green : {2:d}, blue : {2:d}".format(
             boundary, its, red, green, blue))
 
+    # *******************************************
+    # Colour lookup table for rendering, see paletteTable.
+    # Compiled again only if the boundaries or maximum iterations change.
+    # *******************************************
+    def table(self, maxIterations):
+        boundaries = tuple((b.itLimit, b.colRed, b.colGreen, b.colBlue) for b in self.colBoundaries)
+        if (boundaries, maxIterations) != self.tableKey:
+            self.colTable = paletteTable(boundaries, maxIterations, self.config["Colours"]["paletteTableSize"])
+            self.tableKey = (boundaries, maxIterations)
+            self.logger.debug("Compiled colour palette table, size : {0:d}".format(self.colTable.shape[0]))
+        return self.colTable
+
     # *******************************************
     # Save colour palette to file.
     # *******************************************
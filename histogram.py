@@ -5,14 +5,16 @@ import logging.handlers
 import gi
 import math
 import json
-import matplotlib.pyplot as plt
+import numpy as np
+from imageCalc import histogramCounts
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_gtk3agg import FigureCanvasGTK3Agg as fc
 
 # *******************************************
 # Classes needs Gtk version 3.0.
 # *******************************************
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, GLib
 
 # *******************************************
 # Histogram class for iteration divergence histogram.
@@ -40,56 +42,93 @@ class histogramPlot():
         self.buttonUpdateHistogram = self.builder.get_object("updateHistBtn")
         self.buttonUpdateHistogram.connect('clicked', self.updateHistogram)
 
+        # Figure and canvas are created on the first plot, and kept.
+        self.fig = None
+        self.canvas = None
+        self.axes = None
+
+        # Plotted bars or line, and the plot settings they were plotted with.
+        self.artist = None
+        self.artistKey = None
+
+        # Set while a redraw is waiting for the Gtk main loop to be idle.
+        self.drawPending = False
+
+        # Derivative of histogram, if requested.
+        self.firstDeriv = None
+
     # *******************************************
     # Plot histogram with current image calculations.
+    # Plot is drawn when the Gtk main loop is next idle, so that a number of
+    # requests in quick succession only draw the plot once.
     # *******************************************
     def plotHistogram(self):
-        # Create the figure to hold the image canvas.
-        self.fig = plt.figure()
+        if not self.drawPending:
+            self.drawPending = True
+            GLib.idle_add(self.drawHistogram)
 
-        # Create the canvas to hold the plot image.
-        self.canvas = fc(self.fig)
+    # *******************************************
+    # Draw histogram plot.
+    # Figure is reused, updating the bars or line in place if the plot
+    # settings and number of bins are unchanged.
+    # *******************************************
+    def drawHistogram(self):
+        self.drawPending = False
+
+        # Create the figure and canvas the first time, and add to the box container.
+        if self.fig is None:
+            self.fig = Figure()
+            self.canvas = fc(self.fig)
+            self.axes = self.fig.add_subplot(1, 1, 1)
+            for child in self.histBox.get_children():
+                self.histBox.remove(child)
+            self.histBox.pack_start(self.canvas, True, True, 0)
 
-        # Add the canvas to the box container.
-        # First remove any other children (previous plots).
-        for child in self.histBox.get_children():
-            self.histBox.remove(child)
-        self.histBox.pack_start(self.canvas, True, True, 0)
+        # Put divergence iterations into bins for histogram plot.
+        self.doHistogramBins()
 
         # Calculate derivatives.
         # Potentially use them for detecting turning points for colour changes.
-        # Not being plotted at this stage.
-        firstDeriv = [0 for i in range(self.chaos.maxIterations)]
-        for i in range (1, (self.chaos.maxIterations - 1)):
-            firstDeriv[i-1] = self.chaos.hist[i] - self.chaos.hist[i-1]
-
-        # Put divergence iterations into bins for histogram plot.
-        self.doHistogramBins()
+        # Not being plotted at this stage, so only calculated if requested.
+        if self.chaos.histDerivative == True :
+            self.firstDeriv = np.diff(self.chaos.hist)
 
         # Option to not include max iterations in histogram.
         # Depending on the image max iterations can swamp the histogram.
-        # Also option to plot as bar graph or as line plot instead.
         if self.chaos.incMaxIterations == True :
-            if self.chaos.histLinePlot == True :
-                plt.plot(self.chaos.bins, self.chaos.hist, color='blue', linewidth=1, marker='o', markersize=2)
-            else:
-                plt.bar(self.chaos.bins, self.chaos.hist, color='blue')
+            bins = self.chaos.bins
+            hist = self.chaos.hist
         else:
+            bins = self.chaos.bins[:-1]
+            hist = self.chaos.hist[:-1]
+
+        # Also option to plot as bar graph or as line plot instead.
+        key = (self.chaos.histLinePlot == True, len(bins))
+        if key != self.artistKey:
+            self.axes.clear()
             if self.chaos.histLinePlot == True :
-                plt.plot(self.chaos.bins[:-1], self.chaos.hist[:-1], color='blue', linewidth=1, marker='o', markersize=2)
+                self.artist = self.axes.plot(bins, hist, color='blue', linewidth=1, marker='o', markersize=2)[0]
             else:
-                plt.bar(self.chaos.bins[:-1], self.chaos.hist[:-1], color='blue')
-        plt.xlabel('Iteration on Divergence')
-        plt.ylabel('Frequency')
-        plt.title('Histogram of Divergence Iterations')
+                self.artist = self.axes.bar(bins, hist, color='blue')
+            self.artistKey = key
+            self.axes.set_xlabel('Iteration on Divergence')
+            self.axes.set_ylabel('Frequency')
+            self.axes.set_title('Histogram of Divergence Iterations')
+            self.axes.minorticks_on()
+            self.axes.tick_params(which='major', length=8, width=2, direction='out')
+            self.axes.tick_params(which='minor', length=4, width=2, direction='out')
+        elif self.chaos.histLinePlot == True :
+            self.artist.set_ydata(hist)
+        else:
+            for bar, count in zip(self.artist, hist):
+                bar.set_height(count)
 
         # Option to use log scale for iteration count axis (y).
         # Depending on the plot can make it easier to read.
-        if self.chaos.logItsCounts == True :
-            plt.yscale('log')
-        plt.minorticks_on()
-        plt.tick_params(which='major', length=8, width=2, direction='out')
-        plt.tick_params(which='minor', length=4, width=2, direction='out')
+        self.axes.set_yscale('log' if self.chaos.logItsCounts == True else 'linear')
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.canvas.draw_idle()
 
         # Show the histogram dialog.
         self.winHistogram.show_all()
@@ -97,6 +136,9 @@ class histogramPlot():
         # Histogram present flag set.
         self.chaos.histogramPresent = True
 
+        # Don't call again.
+        return False
+
     # *******************************************
     # Update histogram plot with current image calculations.
     # Used if no auto-update, but also used if changing plot settings.
@@ -107,29 +149,25 @@ class histogramPlot():
 
     # *******************************************
     # Put iteration data into bins.
+    # Histogram is normally kept up to date by image generation, from the
+    # histograms of the tiles calculated, so only need to put the whole
+    # image into bins if it isn't, e.g. image data loaded from file.
     # *******************************************
     def doHistogramBins(self):
-        self.logger.debug("Putting divergent interations into histogram bins.")
-
         # Reinitialise histogram bins as max iterations may have changed.
-        self.chaos.bins = [(i + 1) for i in range(self.chaos.maxIterations)]
-        self.chaos.hist = [0 for i in range(self.chaos.maxIterations)]
-        self.chaos.lowBin = 0
+        if len(self.chaos.bins) != self.chaos.maxIterations:
+            self.chaos.bins = [(i + 1) for i in range(self.chaos.maxIterations)]
 
         # Need to get iterations into single array of iteration occurances.
-        for bin in range (0, self.chaos.maxIterations):
-            self.chaos.hist[bin] = 0
-        for r in range (0, self.chaos.imageHeight):
-            for c in range (0, self.chaos.imageWidth):
-                bin = math.floor(self.chaos.iterations[r][c]) - 1
-                self.chaos.hist[bin] += 1
+        if (not self.chaos.histValid) or (len(self.chaos.hist) != self.chaos.maxIterations):
+            self.logger.debug("Putting divergent interations into histogram bins.")
+            self.chaos.hist = histogramCounts(self.chaos.iterations, self.chaos.maxIterations)
+            self.chaos.histValid = True
 
         # Look for lowest non-zero bin.
         # Used for black rendering to maximize colour range.
-        for i, bin in enumerate(self.chaos.hist):
-            if bin > 0:
-                break
-        self.chaos.lowBin = i
+        used = np.flatnonzero(self.chaos.hist)
+        self.chaos.lowBin = int(used[0]) if used.size > 0 else self.chaos.maxIterations - 1
         self.logger.debug("Lowest non-zero bin for iteration histogram : {0:d}".format(self.chaos.lowBin))
 
     # *******************************************
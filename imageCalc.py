@@ -5,6 +5,597 @@ import logging.handlers
 import threading
 import math
 import cmath
+import numpy as np
+
+from iterBuffer import *
+
+# Largest distance, as a fraction of a pixel, for pixels of two views to
+# count as the same point.
+alignTolerance = 1e-6
+
+# Periodicity check starts at this iteration, as most escaping points have
+# escaped by then, and compares orbits with the checkpoint every stride
+# iterations. Keeps the check cheap for views of mostly escaping points.
+periodCheckStart = 64
+periodCheckStride = 16
+
+# *******************************************
+# Check for points in the main cardioid or the period-2 bulb.
+# These points never diverge, so don't need to be iterated.
+# Works for single points or numpy arrays of points.
+# *******************************************
+def inMainBulbs(real, imag):
+    imag2 = imag * imag
+    q = ((real - 0.25) * (real - 0.25)) + imag2
+    cardioid = (q * (q + (real - 0.25))) <= (0.25 * imag2)
+    bulb = (((real + 1.0) * (real + 1.0)) + imag2) <= 0.0625
+    return cardioid | bulb
+
+# *******************************************
+# Vectorised escape time calculation.
+# Takes an array of complex points and returns an array (same shape)
+# of fractional divergence values, the same values that the per pixel
+# loop in imageCalc.run calculates.
+# Points still iterating are kept in a shrinking active set, so escaped
+# points cost nothing in later iterations.
+# Optionally points in the main cardioid and period-2 bulb are set to
+# maximum iterations without iterating.
+# Optionally points whose orbit returns to within periodTolerance of a
+# checkpoint value are periodic, so are set to maximum iterations.
+# Checkpoints are taken at iterations 1, 2, 4, 8... (Brent's method).
+# Calculation statistics are added to the stats dictionary if given.
+# Optionally continues points from function values startFn, with startIts
+# the next iteration to calculate; otherwise starts at Fn = 0, iteration 1.
+# If capped dictionary is given, it gets the state of points that reached
+# maximum iterations, so that they can be continued later:
+# "index" of point, last function value "fn", and next iteration "its".
+# Points known never to diverge (main bulbs, periodic) have "its" of 0.
+# *******************************************
+def escapeTime(c, maxIterations, cardioidCheck=False, stats=None, periodTolerance=0.0, startFn=None, startIts=1, capped=None):
+    shape = c.shape
+    c = c.ravel()
+
+    # Iteration counts and final function values for all points.
+    # Points that never diverge finish with the maximum iteration count.
+    numIterations = np.full(c.size, maxIterations, dtype=np.float64)
+    pxFnFinal = np.zeros(c.size, dtype=np.complex128)
+
+    # Active set of points, with their index into the full point array.
+    active = np.arange(c.size)
+    activeC = c.copy()
+    if startFn is None:
+        pxFn = np.zeros(c.size, dtype=np.complex128)
+    else:
+        pxFn = startFn.ravel().copy()
+
+    # Points known never to diverge.
+    interior = []
+
+    # Remove points in the main cardioid and period-2 bulb from the active set.
+    if cardioidCheck:
+        outside = ~inMainBulbs(c.real, c.imag)
+        interior.append(active[~outside])
+        active = active[outside]
+        activeC = activeC[outside]
+        pxFn = pxFn[outside]
+        if stats is not None:
+            stats["cardioidSkipped"] = stats.get("cardioidSkipped", 0) + int(c.size - active.size)
+
+    # Periodicity checkpoint values (by point, so they don't need removing
+    # as points diverge), iteration of last checkpoint (None until the
+    # first) and of next checkpoint.
+    # Checkpoints are at doubling intervals (Brent), so any period is found.
+    periodTol2 = periodTolerance * periodTolerance
+    pxFnCheck = None
+    lastCheck = None
+    nextCheck = max(startIts, periodCheckStart)
+    periodic = 0
+
+    for its in range (startIts, maxIterations):
+        # Mandelbrot function is Fn+1 = Fn^2 + pt
+        pxFn *= pxFn
+        pxFn += activeC
+
+        # Check for orbit returning to checkpoint, i.e. a periodic point.
+        if periodTol2 > 0.0:
+            if its == nextCheck:
+                if pxFnCheck is None:
+                    pxFnCheck = np.zeros(c.size, dtype=np.complex128)
+                pxFnCheck[active] = pxFn
+                lastCheck = its
+                nextCheck *= 2
+            elif (lastCheck is not None) and (((its - lastCheck) % periodCheckStride) == 0):
+                diff = pxFn - pxFnCheck[active]
+                repeated = ((diff.real * diff.real) + (diff.imag * diff.imag)) < periodTol2
+                if repeated.any():
+                    # Periodic points never diverge, remove them from the active set.
+                    # They keep maximum iterations.
+                    pxFnFinal[active[repeated]] = pxFn[repeated]
+                    interior.append(active[repeated])
+                    periodic += int(repeated.sum())
+                    notRepeated = ~repeated
+                    active = active[notRepeated]
+                    activeC = activeC[notRepeated]
+                    pxFn = pxFn[notRepeated]
+                    if active.size == 0:
+                        break
+
+        # Check for divergence using squared modulus, |Fn|^2 >= 4.
+        # Saves the square root of the modulus.
+        modFn2 = (pxFn.real * pxFn.real) + (pxFn.imag * pxFn.imag)
+        diverged = modFn2 >= 4.0
+        if diverged.any():
+            # Record diverged points and remove them from the active set.
+            numIterations[active[diverged]] = its
+            pxFnFinal[active[diverged]] = pxFn[diverged]
+            stillActive = ~diverged
+            active = active[stillActive]
+            activeC = activeC[stillActive]
+            pxFn = pxFn[stillActive]
+            if active.size == 0:
+                break
+
+    # Points that didn't diverge keep their last function value.
+    pxFnFinal[active] = pxFn
+
+    if (stats is not None) and (periodTol2 > 0.0):
+        stats["periodic"] = stats.get("periodic", 0) + periodic
+
+    # State of points that reached maximum iterations.
+    if capped is not None:
+        interior = np.concatenate(interior + [np.zeros(0, dtype=np.int64)])
+        capped["index"] = np.concatenate((active, interior))
+        capped["fn"] = np.concatenate((pxFn, np.zeros(interior.size, dtype=np.complex128)))
+        capped["its"] = np.concatenate((np.full(active.size, maxIterations, dtype=np.int32), np.zeros(interior.size, dtype=np.int32)))
+
+    return smoothIterations(numIterations, pxFnFinal, maxIterations).reshape(shape)
+
+# *******************************************
+# Perturbation escape time calculation, for deep zooms.
+# Points are given as offsets (deltas) from a reference point, whose
+# orbit has been calculated in high precision. Each point is iterated
+# as the offset of its orbit from the reference orbit, which can be
+# done in normal (double) precision:
+#   d(n+1) = 2.Z(n).d(n) + d(n)^2 + dc
+# If a point's orbit gets closer to zero than its offset is big, or the
+# reference orbit runs out (it diverged), the offset loses precision
+# (a glitch). The point is then rebased to the start of the reference
+# orbit, i.e. the offset becomes the orbit value itself.
+# Optionally the first seriesSkip iterations are skipped, starting from
+# offsets given by the series approximation with coefficients (A, B, C).
+# Returns same values as escapeTime.
+# *******************************************
+def perturbEscapeTime(dc, orbit, maxIterations, stats=None, seriesSkip=0, seriesCoeffs=None):
+    shape = dc.shape
+    dc = dc.ravel()
+    lastRef = orbit.size - 1
+
+    if seriesSkip > 0:
+        # Start from the series approximation offsets.
+        a, b, c = seriesCoeffs
+        delta = ((((c * dc) + b) * dc) + a) * dc
+
+        # Points that diverged within the skipped iterations are calculated from the start.
+        pxFn = orbit[seriesSkip] + delta
+        early = ((pxFn.real * pxFn.real) + (pxFn.imag * pxFn.imag)) >= 4.0
+        if early.any():
+            mu = np.empty(dc.size, dtype=np.float64)
+            mu[early] = perturbEscapeTime(dc[early], orbit, maxIterations, stats)
+            mu[~early] = perturbEscapeTime(dc[~early], orbit, maxIterations, stats, seriesSkip, seriesCoeffs)
+            return mu.reshape(shape)
+    else:
+        delta = np.zeros(dc.size, dtype=np.complex128)
+
+    # Iteration counts and final function values for all points.
+    numIterations = np.full(dc.size, maxIterations, dtype=np.float64)
+    pxFnFinal = np.zeros(dc.size, dtype=np.complex128)
+
+    # Active set of points, with offset from reference orbit and
+    # iteration in the reference orbit they are offset from.
+    active = np.arange(dc.size)
+    activeDc = dc.copy()
+    refIts = np.full(dc.size, seriesSkip, dtype=np.int64)
+    rebased = 0
+
+    for its in range (seriesSkip + 1, maxIterations):
+        # Iterate offset from reference orbit.
+        delta = (((2.0 * orbit[refIts]) + delta) * delta) + activeDc
+        refIts += 1
+        pxFn = orbit[refIts] + delta
+
+        # Check for divergence using squared modulus.
+        modFn2 = (pxFn.real * pxFn.real) + (pxFn.imag * pxFn.imag)
+        diverged = modFn2 >= 4.0
+
+        # Rebase glitched points to start of reference orbit.
+        modDelta2 = (delta.real * delta.real) + (delta.imag * delta.imag)
+        rebase = ((modFn2 < modDelta2) | (refIts == lastRef)) & ~diverged
+        if rebase.any():
+            delta[rebase] = pxFn[rebase]
+            refIts[rebase] = 0
+            rebased += int(rebase.sum())
+
+        if diverged.any():
+            # Record diverged points and remove them from the active set.
+            numIterations[active[diverged]] = its
+            pxFnFinal[active[diverged]] = pxFn[diverged]
+            stillActive = ~diverged
+            active = active[stillActive]
+            activeDc = activeDc[stillActive]
+            delta = delta[stillActive]
+            refIts = refIts[stillActive]
+            if active.size == 0:
+                break
+
+    # Points that didn't diverge keep their last function value.
+    pxFnFinal[active] = orbit[refIts] + delta
+
+    if stats is not None:
+        stats["rebased"] = stats.get("rebased", 0) + rebased
+
+    return smoothIterations(numIterations, pxFnFinal, maxIterations).reshape(shape)
+
+# *******************************************
+# Fractional divergence from iteration counts and final function values.
+# Fractional divergence can be approximated as mu = log (log(|Z(n)|)) / log(2)
+# Limited to maximum iterations.
+# *******************************************
+def smoothIterations(numIterations, pxFnFinal, maxIterations):
+    modFn = np.abs(pxFnFinal)
+    muLog = np.zeros(modFn.size, dtype=np.float64)
+    large = modFn > math.e
+    muLog[large] = np.log(np.log(modFn[large])) / math.log(2.0)
+    mu = numIterations + 1 - muLog
+    np.minimum(mu, maxIterations, out=mu)
+    return mu
+
+# *******************************************
+# Real and imaginary parts of the points for image rows and columns.
+# Calculated from the image centre for every pixel, so the same
+# pixel always gets the same point however the image is split up.
+# *******************************************
+def viewPoints(centreReal, centreImag, pxSize, width, height, rows, cols):
+    real = centreReal + ((cols - (width / 2.0)) * pxSize)
+    imag = centreImag + (((height / 2.0) - rows) * pxSize)
+    return real, imag
+
+# *******************************************
+# Pixels of a view that line up exactly with pixels of an earlier view.
+# Works on one axis (rows or columns) of an image of the given size.
+# Shift is the distance from the old view centre to the new one, in old
+# pixels; ratio is the new pixel size over the old pixel size.
+# Only new pixels in the range newRange that land on old pixels in the
+# range oldRange are aligned.
+# Returns boolean array of aligned new pixels, and their old pixels.
+# *******************************************
+def alignPixels(shift, ratio, size, newRange, oldRange):
+    new = np.arange(size)
+    old = shift + ((new - (size / 2.0)) * ratio) + (size / 2.0)
+    nearest = np.rint(old)
+    aligned = ((np.abs(old - nearest) < alignTolerance) & (new >= newRange[0]) & (new < newRange[1])
+        & (nearest >= oldRange[0]) & (nearest < oldRange[1]))
+    return aligned, nearest[aligned].astype(np.int64)
+
+# *******************************************
+# Calculate fractional divergence values for image pixels.
+# Job is dictionary of view details and calculation options.
+# Rows and columns are arrays of pixel rows and columns in the image.
+# Uses perturbation from the reference orbit if the job has one, attaching
+# to its shared memory unless the job has the orbit array itself.
+# If state is given (see newState), the state of pixels reaching maximum
+# iterations is added to it, except for perturbation calculations.
+# *******************************************
+def calcPoints(job, rows, cols, stats=None, state=None):
+    if job["orbitName"] is not None:
+        # Offsets from reference orbit at image centre.
+        real, imag = viewPoints(0.0, 0.0, job["pxSize"], job["imageWidth"], job["imageHeight"], rows, cols)
+        orbit = job["orbit"]
+        if orbit is None:
+            orbit = attachBuffer(job["orbitName"], (job["orbitLength"],), np.complex128, "orbit")
+        return perturbEscapeTime(real + (1j * imag), orbit, job["maxIterations"], stats, job["seriesSkip"], job["seriesCoeffs"])
+
+    real, imag = viewPoints(job["centreReal"], job["centreImag"], job["pxSize"], job["imageWidth"], job["imageHeight"], rows, cols)
+    capped = None if state is None else {}
+    mu = escapeTime(real + (1j * imag), job["maxIterations"], job["cardioidCheck"], stats, job["periodTolerance"], capped=capped)
+    if state is not None:
+        addState(state, rows.ravel()[capped["index"]], cols.ravel()[capped["index"]], capped["fn"], capped["its"])
+    return mu
+
+# *******************************************
+# State of pixels that reached maximum iterations.
+# Pixel rows and columns, last function values and next iterations,
+# as lists of arrays while being collected.
+# *******************************************
+def newState():
+    return {"rows" : [], "cols" : [], "fn" : [], "its" : []}
+
+# *******************************************
+# Add pixels to maximum iterations state.
+# *******************************************
+def addState(state, rows, cols, fn, its):
+    state["rows"].append(rows.astype(np.int32))
+    state["cols"].append(cols.astype(np.int32))
+    state["fn"].append(fn)
+    state["its"].append(its.astype(np.int32))
+
+# *******************************************
+# Combine maximum iterations state lists into arrays.
+# *******************************************
+def joinState(state):
+    return {
+        "rows" : np.concatenate(state["rows"] + [np.zeros(0, dtype=np.int32)]),
+        "cols" : np.concatenate(state["cols"] + [np.zeros(0, dtype=np.int32)]),
+        "fn" : np.concatenate(state["fn"] + [np.zeros(0, dtype=np.complex128)]),
+        "its" : np.concatenate(state["its"] + [np.zeros(0, dtype=np.int32)])
+    }
+
+# *******************************************
+# Vectorised calculation of a box of the image.
+# Ranges as for imageCalc, i.e. end of range not included.
+# Returns array of fractional divergence values, rows by columns.
+# *******************************************
+def calcBox(job, rowRange, colRange, stats=None, state=None):
+    rows, cols = np.meshgrid(np.arange(rowRange[0], rowRange[1]), np.arange(colRange[0], colRange[1]), indexing='ij')
+    return calcPoints(job, rows, cols, stats, state)
+
+# *******************************************
+# Calculate points expected to escape at given iterations (escape bands).
+# Points are iterated that many times without checking for divergence,
+# then checked to have escaped at exactly that iteration, in which case
+# their fractional divergence values are the same as from escapeTime.
+# Points are sorted by iterations, so those done drop off the front.
+# Not for perturbation (deep zoom) jobs.
+# Returns array of fractional divergence values, and boolean array of
+# points that escaped at their iterations (other values not valid).
+# *******************************************
+def calcBand(job, rows, cols, escapeIts):
+    order = np.argsort(escapeIts, kind='stable')
+    escapeIts = escapeIts[order]
+    real, imag = viewPoints(job["centreReal"], job["centreImag"], job["pxSize"], job["imageWidth"], job["imageHeight"], rows[order], cols[order])
+    c = real + (1j * imag)
+    pxFn = np.zeros(c.size, dtype=np.complex128)
+    pxFnFinal = np.zeros(c.size, dtype=np.complex128)
+    escaped = np.zeros(c.size, dtype=bool)
+
+    # Points that escaped earlier overflow, and fail the check.
+    with np.errstate(over='ignore', invalid='ignore'):
+        first = 0
+        for its in range (1, int(escapeIts[-1]) + 1) if c.size > 0 else ():
+            # Points escaping at this iteration, must not have escaped before.
+            last = np.searchsorted(escapeIts, its, side='right')
+            if last > first:
+                fn = pxFn[first:last]
+                escaped[first:last] = ((fn.real * fn.real) + (fn.imag * fn.imag)) < 4.0
+            active = slice(first, c.size)
+            pxFn[active] *= pxFn[active]
+            pxFn[active] += c[active]
+            if last > first:
+                fn = pxFn[first:last]
+                escaped[first:last] &= ((fn.real * fn.real) + (fn.imag * fn.imag)) >= 4.0
+                pxFnFinal[first:last] = fn
+                first = last
+
+    mu = np.empty(c.size, dtype=np.float64)
+    mu[order] = smoothIterations(escapeIts.astype(np.float64), np.where(escaped, pxFnFinal, 2.0), job["maxIterations"])
+    done = np.empty(c.size, dtype=bool)
+    done[order] = escaped
+    return mu, done
+
+# *******************************************
+# Calculation of a box of the image using rectangle subdivision.
+# Only the border of a rectangle is calculated; if all of the border
+# reaches maximum iterations the inside is filled with it. If all of the
+# border escapes at the same iteration (an escape band), the inside is
+# calculated by calcBand, which only iterates a fixed number of times,
+# and any pixels that don't escape with the band calculated in full.
+# Otherwise the rectangle is split into four and the same done for each.
+# Escape bands are only used for views that aren't deep zooms.
+# Rectangles are processed a level at a time so that all the borders
+# at each level are calculated together.
+# Rectangles no bigger than the job minimum size are calculated in full.
+# Pixels filled at maximum iterations are added to the state to start
+# from the beginning, as they haven't been iterated.
+# Same arguments and return value as calcBox.
+# *******************************************
+def calcSubdivide(job, rowRange, colRange, stats=None, state=None):
+    minSize = job["subdivideMinSize"]
+    rows = rowRange[1] - rowRange[0]
+    cols = colRange[1] - colRange[0]
+    mu = np.zeros((rows, cols), dtype=np.float64)
+    done = np.zeros((rows, cols), dtype=bool)
+    filled = 0
+
+    # Rectangles are (first row, last row, first column, last column) in box, inclusive.
+    rects = [(0, rows - 1, 0, cols - 1)]
+    while len(rects) > 0:
+        # Get the border pixels of all rectangles that still need calculating.
+        # Small rectangles are calculated in full.
+        calc = np.zeros((rows, cols), dtype=bool)
+        for r0, r1, c0, c1 in rects:
+            if ((r1 - r0) <= minSize) or ((c1 - c0) <= minSize):
+                calc[r0:r1 + 1, c0:c1 + 1] = True
+            else:
+                calc[r0, c0:c1 + 1] = True
+                calc[r1, c0:c1 + 1] = True
+                calc[r0:r1 + 1, c0] = True
+                calc[r0:r1 + 1, c1] = True
+        calc &= ~done
+
+        # Calculate the pixels.
+        calcRows, calcCols = np.nonzero(calc)
+        mu[calcRows, calcCols] = calcPoints(job, calcRows + rowRange[0], calcCols + colRange[0], stats, state)
+        done |= calc
+
+        # Fill or split the rectangles.
+        # Insides of escape band rectangles are calculated together.
+        nextRects = []
+        bandIts = np.zeros((rows, cols), dtype=np.int32)
+        for r0, r1, c0, c1 in rects:
+            if ((r1 - r0) <= minSize) or ((c1 - c0) <= minSize):
+                continue
+            border = np.concatenate((mu[r0, c0:c1 + 1], mu[r1, c0:c1 + 1], mu[r0 + 1:r1, c0], mu[r0 + 1:r1, c1]))
+
+            # Iterations border pixels escaped at, one less than their
+            # fractional divergence values rounded up.
+            low = border.min()
+            high = border.max()
+            if low >= job["maxIterations"]:
+                # Border all at maximum iterations so fill inside of rectangle.
+                mu[r0 + 1:r1, c0 + 1:c1] = job["maxIterations"]
+                done[r0 + 1:r1, c0 + 1:c1] = True
+                filled += (r1 - r0 - 1) * (c1 - c0 - 1)
+                if state is not None:
+                    fillRows, fillCols = np.meshgrid(np.arange(r0 + 1, r1) + rowRange[0], np.arange(c0 + 1, c1) + colRange[0], indexing='ij')
+                    addState(state, fillRows.ravel(), fillCols.ravel(), np.zeros(fillRows.size, dtype=np.complex128), np.ones(fillRows.size, dtype=np.int32))
+            elif (job["orbitName"] is None) and (math.ceil(low) == math.ceil(high)) and (high < job["maxIterations"]):
+                # Border all in one escape band so calculate inside as the band.
+                bandIts[r0 + 1:r1, c0 + 1:c1] = math.ceil(low) - 1
+                done[r0 + 1:r1, c0 + 1:c1] = True
+            else:
+                # Split into four, sharing the middle row and column.
+                rm = (r0 + r1) // 2
+                cm = (c0 + c1) // 2
+                nextRects += [(r0, rm, c0, cm), (r0, rm, cm, c1), (rm, r1, c0, cm), (rm, r1, cm, c1)]
+        rects = nextRects
+
+        fillRows, fillCols = np.nonzero(bandIts)
+        if fillRows.size > 0:
+            values, escaped = calcBand(job, fillRows + rowRange[0], fillCols + colRange[0], bandIts[fillRows, fillCols])
+            mu[fillRows[escaped], fillCols[escaped]] = values[escaped]
+            filled += int(escaped.sum())
+
+            # Calculate pixels that didn't escape with their band in full.
+            missed = ~escaped
+            if missed.any():
+                mu[fillRows[missed], fillCols[missed]] = calcPoints(job, fillRows[missed] + rowRange[0], fillCols[missed] + colRange[0], stats, state)
+
+    if stats is not None:
+        stats["subdivideFilled"] = stats.get("subdivideFilled", 0) + filled
+
+    return mu
+
+# *******************************************
+# Get pixels selected in a box.
+# Selection is (include rows, include columns, exclusions), where exclusions
+# is a list of (exclude rows, exclude columns) pairs. Rows and columns are
+# each a boolean array for the rows or columns of the box, or None for all.
+# Pixels selected are those in an included row and an included column,
+# that aren't also in both the excluded rows and columns of any exclusion.
+# Returns arrays of rows and columns (in the box) of selected pixels.
+# *******************************************
+def selectPixels(selection, rows, cols):
+    incRows, incCols, exclusions = selection
+    if incRows is None:
+        incRows = np.ones(rows, dtype=bool)
+    if incCols is None:
+        incCols = np.ones(cols, dtype=bool)
+    selected = np.outer(incRows, incCols)
+
+    for excRows, excCols in exclusions:
+        if excRows is None:
+            excRows = np.ones(rows, dtype=bool)
+        if excCols is None:
+            excCols = np.ones(cols, dtype=bool)
+        selected &= ~np.outer(excRows, excCols)
+
+    return np.nonzero(selected)
+
+# *******************************************
+# Histogram of fractional divergence values.
+# Bin is whole iterations less one, so bins are for 1 to maximum iterations.
+# Values below one go in the first bin, and above maximum iterations the last,
+# so a value's bin doesn't depend on maximum iterations below it.
+# Returns array of counts for each bin.
+# *******************************************
+def histogramCounts(values, maxIterations):
+    bins = values.astype(np.intp) - 1
+    np.clip(bins, 0, maxIterations - 1, out=bins)
+    return np.bincount(bins.ravel(), minlength=maxIterations)
+
+# *******************************************
+# Continue calculating pixels that reached maximum iterations.
+# Job resume is the state of pixels from an earlier calculation with
+# lower maximum iterations (see joinState). Pixels known never to
+# diverge are just set to the new maximum iterations.
+# Same return value as calcTile, except the histogram is the change in the
+# histogram of the image from continuing the pixels.
+# *******************************************
+def calcResume(job, iterations):
+    rows, cols, fn, its = job["resume"]
+    bufferRows = rows - job["bufferFirstRow"]
+    stats = {}
+    state = newState()
+    hist = -histogramCounts(iterations[bufferRows, cols], job["maxIterations"])
+
+    # Pixels known never to diverge.
+    interior = its == 0
+    iterations[bufferRows[interior], cols[interior]] = job["maxIterations"]
+    addState(state, rows[interior], cols[interior], fn[interior], its[interior])
+
+    # Continue the rest, grouped by the iteration they continue from.
+    for startIts in np.unique(its[~interior]):
+        group = its == startIts
+        real, imag = viewPoints(job["centreReal"], job["centreImag"], job["pxSize"], job["imageWidth"], job["imageHeight"], rows[group], cols[group])
+        capped = {}
+        iterations[bufferRows[group], cols[group]] = escapeTime(real + (1j * imag), job["maxIterations"], job["cardioidCheck"], stats, job["periodTolerance"],
+            fn[group], int(startIts), capped)
+        addState(state, rows[group][capped["index"]], cols[group][capped["index"]], capped["fn"], capped["its"])
+    stats["resumed"] = int(rows.size)
+    hist += histogramCounts(iterations[bufferRows, cols], job["maxIterations"])
+
+    return None, None, stats, joinState(state), hist
+
+# *******************************************
+# Calculate a tile of the image.
+# Used by the tile scheduler worker processes.
+# Job is dictionary of view details and tile row and column ranges.
+# Job can also have a selection of pixels in the tile to calculate,
+# see selectPixels, or the state of pixels to continue, see calcResume.
+# Tile fractional divergence values are written directly into the
+# shared iteration buffer; returns the tile ranges, calculation statistics,
+# if the job keeps state the state of pixels reaching maximum iterations,
+# and if the job has histogram rows (boolean array of the tile rows) the
+# histogram of the tile in those rows, see histogramCounts.
+# *******************************************
+def calcTile(job):
+    rowRange = job["rowRange"]
+    colRange = job["colRange"]
+    stats = {}
+
+    # Buffer holds the image rows from its first row, see iterationBuffer.
+    first = job["bufferFirstRow"]
+    iterations = attachBuffer(job["bufferName"], (job["bufferHeight"], job["imageWidth"]))
+
+    # Continue pixels from earlier calculation.
+    if job["resume"] is not None:
+        return calcResume(job, iterations)
+
+    state = newState() if job["keepState"] else None
+
+    # Calculate selected pixels only.
+    if job["selection"] is not None:
+        rows, cols = selectPixels(job["selection"], rowRange[1] - rowRange[0], colRange[1] - colRange[0])
+        rows += rowRange[0]
+        cols += colRange[0]
+        iterations[rows - first, cols] = calcPoints(job, rows, cols, stats, state)
+    else:
+        # Calculate whole tile, or use rectangle subdivision.
+        if job["subdivide"]:
+            mu = calcSubdivide(job, rowRange, colRange, stats, state)
+        else:
+            mu = calcBox(job, rowRange, colRange, stats, state)
+
+        # Write tile into the shared iteration buffer.
+        iterations[rowRange[0] - first:rowRange[1] - first, colRange[0]:colRange[1]] = mu
+
+    if state is not None:
+        state = joinState(state)
+
+    # Histogram of tile as a by-product of calculating it.
+    hist = None
+    if job["histRows"] is not None:
+        hist = histogramCounts(iterations[rowRange[0] - first:rowRange[1] - first, colRange[0]:colRange[1]][job["histRows"]], job["maxIterations"])
+    return rowRange, colRange, stats, state, hist
 
 # *******************************************
 # Perform inmage calculation thread.
@@ -17,7 +608,7 @@ class imageCalc(threading.Thread):
     # and row and column limit coupletes.
     # For complete image coupletes should be (0, width-1) (0, height-1)
     # *******************************************
-    def __init__(self, threadID, threadName, logger, chaos, rowRange, colRange):
+    def __init__(self, threadID, threadName, logger, chaos, rowRange, colRange, onDone=None):
         threading.Thread.__init__(self)
         self.threadID = threadID
         self.threadName = threadName
@@ -26,27 +617,67 @@ class imageCalc(threading.Thread):
         self.rowRange = rowRange
         self.colRange = colRange
 
+        # Called with the thread when calculation finishes or is cancelled.
+        self.onDone = onDone
+
+        # Set to stop the calculation early.
+        self.cancelled = threading.Event()
+
         # Get pixel increment size.
         self.inc = self.chaos.pxSize
 
+        # Count of pixels skipped in main cardioid and period-2 bulb.
+        self.stats = {}
+
         self.logger.debug("Calculating image rangers, ROWS : ({0:d}, {1:d}), COLUMNS : ({2:d}, {3:d})".format(self.rowRange[0], self.rowRange[1], self.colRange[0], self.colRange[1]))
         self.logger.debug("Image centre location, REAL : {0:f}, IMAGINARY : , {1:f}".format(self.chaos.centreReal, self.chaos.centreImag))
 
         # Determine start point (top left) for box to calculate.
-        self.calcStartX = self.chaos.centreReal - (((self.chaos.imageWidth / 2.0) - self.colRange[0]) * self.inc)
-        self.calcStartY = self.chaos.centreImag + (((self.chaos.imageHeight / 2.0) - self.rowRange[0]) * self.inc)
+        self.calcStartX = float(self.chaos.centreReal) - (((self.chaos.imageWidth / 2.0) - self.colRange[0]) * self.inc)
+        self.calcStartY = float(self.chaos.centreImag) + (((self.chaos.imageHeight / 2.0) - self.rowRange[0]) * self.inc)
         self.logger.debug("Calculating image at start position, REAL : {0:f}, IMAGINARY : {1:f}".format(self.calcStartX, self.calcStartY))
 
     # *******************************************
     # Run method called when thread started.
     # *******************************************
     def run(self):
+        # Use vectorised calculation if selected.
+        if self.chaos.vectorEngine:
+            self.runVector()
+        else:
+            self.runPixels()
+
+        # Report calculation finished.
+        if self.onDone is not None:
+            self.onDone(self)
+
+    # *******************************************
+    # Stop the calculation early.
+    # Calculation stops at the end of the current row or block of rows.
+    # *******************************************
+    def cancel(self):
+        self.cancelled.set()
+
+    # *******************************************
+    # Per pixel version of the run method.
+    # *******************************************
+    def runPixels(self):
         # Initialise complex value of first pixel point.
         pt = complex(self.calcStartX, self.calcStartY)
 
         # Calculate max iterations for all pixels.
+        cardioidSkipped = 0
         for row in range (self.rowRange[0], self.rowRange[1]):
+            if self.cancelled.is_set():
+                break
             for col in range (self.colRange[0], self.colRange[1]):
+                # Points in main cardioid or period-2 bulb never diverge.
+                if self.chaos.cardioidCheck and inMainBulbs(pt.real, pt.imag):
+                    self.chaos.iterations[row][col] = self.chaos.maxIterations
+                    cardioidSkipped += 1
+                    pt = pt + complex(self.inc, 0.0)
+                    continue
+
                 # Initialise divergence to false; keep looping until divergence confirmed.
                 diverges = False
                 # Initialise iteration count.
@@ -89,3 +720,31 @@ class imageCalc(threading.Thread):
             # Increment point to start of next row.
             pt = pt - complex(0.0, self.inc)
             pt = complex(self.calcStartX, pt.imag)
+
+        self.stats["cardioidSkipped"] = cardioidSkipped
+
+    # *******************************************
+    # Vectorised version of the run method.
+    # Calculates the box in blocks of rows as complex arrays.
+    # *******************************************
+    def runVector(self):
+        blockRows = self.chaos.vectorRowBlock
+
+        # Same calculation details as the tile workers use.
+        # Reference orbit is used directly rather than attaching to its
+        # shared memory, which would be left attached in this process.
+        job = self.chaos.tileJob(self.rowRange, self.colRange)
+        if job["orbitName"] is not None:
+            job["orbit"] = self.chaos.refOrbit.orbit
+
+        for blockStart in range (self.rowRange[0], self.rowRange[1], blockRows):
+            if self.cancelled.is_set():
+                break
+            blockEnd = min(blockStart + blockRows, self.rowRange[1])
+            if job["subdivide"]:
+                mu = calcSubdivide(job, (blockStart, blockEnd), self.colRange, self.stats)
+            else:
+                mu = calcBox(job, (blockStart, blockEnd), self.colRange, self.stats)
+
+            # Update number of iterations in the image iterations array.
+            self.chaos.iterations[blockStart:blockEnd, self.colRange[0]:self.colRange[1]] = mu
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+# Lookup table entries per iteration, so that narrow palette bands at high
+# maximum iterations aren't posterised, and the largest table size for them.
+tableStepsPerIteration = 32
+tableSizeLimit = 1 << 22
+
+# *******************************************
+# Size of lookup table for maximum iterations.
+# Size given (configured) is the least size; tables grow with maximum
+# iterations up to the limit.
+# *******************************************
+def tableSize(size, maxIterations):
+    return max(size, min(maxIterations * tableStepsPerIteration, tableSizeLimit))
+
+# *******************************************
+# Compile a colour palette into a lookup table.
+# Boundaries are (iteration limit, red, green, blue) tuples. Only the
+# leading boundaries with increasing iteration limits are useful.
+# Table has a colour for each of tableSize fractional divergence values,
+# evenly spaced from 0 to maximum iterations. Colours are interpolated
+# between boundaries as for getColInRange, and take the first or last
+# boundary colour below or above the boundaries.
+# Returns array of table size by 3 (RGB) bytes.
+# *******************************************
+def paletteTable(boundaries, maxIterations, size):
+    size = tableSize(size, maxIterations)
+    useful = [boundaries[0]]
+    for b in boundaries[1:]:
+        if b[0] > useful[-1][0]:
+            useful.append(b)
+        else:
+            break
+    limits = np.array([b[0] for b in useful], dtype=np.float64)
+    colours = np.array([b[1:] for b in useful], dtype=np.float64)
+
+    # Values are in increasing order, so the values in each band, band b
+    # being above boundary b and not above boundary b + 1, are a slice of
+    # the table. Edges are the ends of the slices.
+    its = np.linspace(0.0, maxIterations, size)
+    edges = np.searchsorted(its, limits, side='right')
+
+    table = np.empty((size, 3), dtype=np.uint8)
+    table[:edges[0]] = colours[0]
+    table[edges[-1]:] = colours[-1]
+
+    for band in range (limits.size - 1):
+        bandIts = its[edges[band]:edges[band + 1]]
+        ratio = (bandIts - limits[band]) / (limits[band + 1] - limits[band])
+        colour = colours[band] + ((colours[band + 1] - colours[band]) * ratio[:, np.newaxis])
+        table[edges[band]:edges[band + 1]] = np.floor(colour)
+
+    return table
+
+# *******************************************
+# Compile a lookup table of shades of grey, for rendering in black.
+# Shades are scaled from the lowest histogram bin used to maximum iterations,
+# to make the most of the range.
+# Table is as for paletteTable.
+# *******************************************
+def greyTable(lowBin, maxIterations, size):
+    size = tableSize(size, maxIterations)
+    its = np.linspace(0.0, maxIterations, size)
+    intensity = np.floor((its - lowBin) * (255.0 / max(maxIterations - lowBin, 1)))
+    np.clip(intensity, 0, 255, out=intensity)
+    table = np.empty((size, 3), dtype=np.uint8)
+    table[...] = intensity.astype(np.uint8)[:, np.newaxis]
+    return table
+
+# *******************************************
+# Pack a lookup table of RGB bytes into 32 bit pixels.
+# Pixels are 0x00RRGGBB in native byte order, as for cairo RGB24 image surfaces.
+# *******************************************
+def packTable(table):
+    rgb = table.astype(np.uint32)
+    return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+# *******************************************
+# Unpack 32 bit pixels into RGB bytes, reverse of packTable.
+# Returns array of rows by columns by 3 (RGB) bytes.
+# *******************************************
+def unpackPixels(pixels):
+    rgb = np.empty(pixels.shape + (3,), dtype=np.uint8)
+    rgb[..., 0] = pixels >> 16
+    rgb[..., 1] = pixels >> 8
+    rgb[..., 2] = pixels
+    return rgb
+
+# *******************************************
+# Render fractional divergence values from a lookup table.
+# Values are rounded to the nearest table entry, see paletteTable.
+# Table entries are written into out in place, so out is an array of rows
+# by columns of table entries, e.g. 32 bit pixels for a packed table.
+# *******************************************
+def renderTable(iterations, table, maxIterations, out):
+    index = iterations * ((table.shape[0] - 1) / maxIterations)
+    np.rint(index, out=index)
+    np.clip(index, 0, table.shape[0] - 1, out=index)
+    np.take(table, index.astype(np.intp), axis=0, out=out)
+
+# *******************************************
+# Shift the contents of an image buffer in place, for a move of the image centre.
+# Positive moves are centre moved right or down, so contents move left or up.
+# Pixels exposed by the move keep their old values, to be recalculated.
+# *******************************************
+def shiftPixels(pixels, hMove, vMove):
+    height, width = pixels.shape[:2]
+    if (abs(hMove) >= width) or (abs(vMove) >= height):
+        return
+
+    # Slice assignment copies overlapping blocks correctly.
+    dstRows = slice(max(0, -vMove), height - max(0, vMove))
+    srcRows = slice(max(0, vMove), height - max(0, -vMove))
+    dstCols = slice(max(0, -hMove), width - max(0, hMove))
+    srcCols = slice(max(0, hMove), width - max(0, -hMove))
+    pixels[dstRows, dstCols] = pixels[srcRows, srcCols]
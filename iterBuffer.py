@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import json
+import os
+import struct
+import numpy as np
+from decimal import Decimal
+from multiprocessing import shared_memory
+
+# Type of the iteration (fractional divergence) values.
+# Single precision is plenty for colouring and halves the memory used.
+iterationType = np.float32
+
+# Quantised iteration values, see quantiseIterations.
+# Whole iterations (16 bits) and fraction in 256ths (8 bits), 3 bytes per pixel.
+quantisedType = np.dtype([('whole', '<u2'), ('fraction', 'u1')])
+
+# Largest value that can be quantised.
+quantiseLimit = 65535
+
+# Image data file magic number and format version.
+# Files without the magic number are the original format, see readIterationData.
+iterationMagic = b'CHAOSDAT'
+iterationVersion = 2
+
+# Original image data file header, see readIterationData.
+legacyHeader = 'iiiffff'
+
+# Iteration values start on a multiple of this many bytes in image data files.
+iterationAlign = 64
+
+# Buffers attached to by worker processes, by kind of buffer.
+# Kept open so each worker only attaches once per buffer.
+attachedBuffers = {}
+
+# *******************************************
+# Iteration buffer class.
+# Holds the image iteration (fractional divergence) values in a shared
+# memory block, so that worker processes can write their tiles directly
+# into it and the GUI can read it without copying.
+# Values are a contiguous array of rows by columns of iterationType.
+# Buffer can hold a band of rows of a taller image, starting at the image
+# row firstRow, which can be moved along to reuse the buffer for each band.
+# *******************************************
+class iterationBuffer():
+    # Initializer / Instance Attributes
+    def __init__(self, logger, width, height, firstRow=0):
+
+        self.logger = logger
+        self.shm = None
+        self.firstRow = firstRow
+        self.resize(width, height)
+
+    # *******************************************
+    # Create (or re-create) buffer for image size.
+    # Buffer is initialised to all zero.
+    # *******************************************
+    def resize(self, width, height):
+        # Release any existing shared memory block.
+        self.close()
+
+        self.width = width
+        self.height = height
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, width * height * np.dtype(iterationType).itemsize))
+
+        # Array of rows by columns backed by the shared memory.
+        self.data = np.ndarray((height, width), dtype=iterationType, buffer=self.shm.buf)
+        self.data.fill(0.0)
+        self.logger.debug("Created shared iteration buffer : {0:s}, width : {1:d}, height : {2:d}".format(self.shm.name, width, height))
+
+    # *******************************************
+    # Name of the shared memory block, for worker processes.
+    # *******************************************
+    def name(self):
+        return self.shm.name
+
+    # *******************************************
+    # Release the shared memory block.
+    # *******************************************
+    def close(self):
+        if self.shm is not None:
+            self.data = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+# *******************************************
+# Get array for a shared memory buffer from a worker process.
+# Attaches to the shared memory block the first time it is used.
+# Only the latest buffer of each kind (e.g. iterations) is kept attached.
+# *******************************************
+def attachBuffer(name, shape, dtype=iterationType, kind="iterations"):
+    if (kind not in attachedBuffers) or (attachedBuffers[kind][0] != name):
+        # Forget any previous buffer of this kind, it has been replaced.
+        if kind in attachedBuffers:
+            attachedBuffers.pop(kind)[1].close()
+        shm = shared_memory.SharedMemory(name=name)
+        attachedBuffers[kind] = (name, shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return attachedBuffers[kind][2]
+
+# *******************************************
+# Quantise iteration values, for compact storage of very large images.
+# Values are split into whole iterations (16 bits, so up to 65535 maximum
+# iterations) and the fraction in 256ths (8 bits), 3 bytes per pixel.
+# Values above the limit can't be stored, and raise ValueError rather than
+# being clipped; see storageType.
+# Returns arrays of whole iterations and fractions.
+# *******************************************
+def quantiseIterations(values):
+    if (values.size > 0) and (values.max() > quantiseLimit):
+        raise ValueError("Iteration values above {0:d} can't be quantised".format(quantiseLimit))
+    scaled = np.rint(np.maximum(values, 0) * 256.0).astype(np.uint32)
+    np.minimum(scaled, (quantiseLimit * 256) + 255, out=scaled)
+    return (scaled >> 8).astype(np.uint16), (scaled & 0xff).astype(np.uint8)
+
+# *******************************************
+# Get iteration values back from quantised whole iterations and fractions.
+# Values are written into out if given, otherwise a new array is returned.
+# *******************************************
+def dequantiseIterations(whole, fraction, out=None):
+    if out is None:
+        out = np.empty(whole.shape, dtype=iterationType)
+    np.multiply(fraction, 1.0 / 256.0, out=out, casting='unsafe')
+    out += whole
+    return out
+
+# *******************************************
+# Type of iteration values stored in image data files.
+# Quantised values if asked for and maximum iterations fits, otherwise
+# single precision (little endian).
+# *******************************************
+def storageType(quantised, maxIterations):
+    if quantised and (maxIterations <= quantiseLimit):
+        return quantisedType
+    return np.dtype(iterationType).newbyteorder('<')
+
+# *******************************************
+# Write image data file.
+# File has a header of the magic number, format version and offset of the
+# iteration values, then the image details (JSON): image size, maximum
+# iterations, image centre (decimal strings, to keep deep zooms), pixel
+# size, image scale and the type of the iteration values ("quantised"
+# for quantised values, see storageType).
+# Iteration values follow as one contiguous array of rows by columns.
+# *******************************************
+def writeIterationData(fname, iterations, maxIterations, centreReal, centreImag, pxSize, imageScale, quantised=False):
+    with open(fname, 'wb') as bf:
+        height, width = iterations.shape
+        dtype = writeIterationHeader(bf, width, height, maxIterations, centreReal, centreImag, pxSize, imageScale, quantised)
+        writeIterationRows(bf, iterations, dtype)
+
+# *******************************************
+# Write image data file header, see writeIterationData.
+# Iteration values can then be written a number of rows at a time, for
+# images too big for memory.
+# Returns the type the iteration values are to be written as.
+# *******************************************
+def writeIterationHeader(bf, width, height, maxIterations, centreReal, centreImag, pxSize, imageScale, quantised=False):
+    dtype = storageType(quantised, maxIterations)
+    details = json.dumps({
+        "width" : width,
+        "height" : height,
+        "maxIterations" : maxIterations,
+        "centreReal" : str(centreReal),
+        "centreImag" : str(centreImag),
+        "pxSize" : float(pxSize),
+        "imageScale" : float(imageScale),
+        "dtype" : "quantised" if dtype == quantisedType else dtype.str
+    }).encode()
+
+    # Pad details so that the iteration values are aligned.
+    size = len(iterationMagic) + struct.calcsize('<II') + len(details)
+    offset = ((size + iterationAlign - 1) // iterationAlign) * iterationAlign
+    bf.write(iterationMagic + struct.pack('<II', iterationVersion, offset) + details + (b' ' * (offset - size)))
+    return dtype
+
+# *******************************************
+# Write rows of iteration values to image data file, after the header.
+# Values are written in one go, as the type returned by writeIterationHeader.
+# *******************************************
+def writeIterationRows(bf, iterations, dtype=None):
+    if dtype == quantisedType:
+        rows = np.empty(iterations.shape, dtype=quantisedType)
+        rows['whole'], rows['fraction'] = quantiseIterations(iterations)
+        rows.tofile(bf)
+    else:
+        iterations.astype(np.dtype(iterationType).newbyteorder('<'), copy=False).tofile(bf)
+
+# *******************************************
+# Read image data file, see writeIterationData.
+# Also reads the original format, of a header of image size and maximum
+# iterations (integers) and image centre, pixel size and image scale
+# (single precision), followed by single precision iteration values.
+# Iteration values are memory mapped from the file, not read in, except
+# quantised values which are converted back to iterationType.
+# Returns dictionary of image details, and array of iteration values.
+# *******************************************
+def readIterationData(fname):
+    with open(fname, 'rb') as bf:
+        magic = bf.read(len(iterationMagic))
+        if magic == iterationMagic:
+            version, offset = struct.unpack('<II', bf.read(struct.calcsize('<II')))
+            if version != iterationVersion:
+                raise ValueError("Image data file version {0:d} not supported : {1:s}".format(version, fname))
+            details = json.loads(bf.read(offset - bf.tell()).decode())
+            details["centreReal"] = Decimal(details["centreReal"])
+            details["centreImag"] = Decimal(details["centreImag"])
+            dtype = details.pop("dtype")
+            dtype = quantisedType if dtype == "quantised" else np.dtype(dtype)
+        else:
+            bf.seek(0)
+            offset = struct.calcsize(legacyHeader)
+            width, height, maxIterations, centreReal, centreImag, pxSize, imageScale = struct.unpack(legacyHeader, bf.read(offset))
+            details = {
+                "width" : width,
+                "height" : height,
+                "maxIterations" : maxIterations,
+                "centreReal" : Decimal(repr(centreReal)),
+                "centreImag" : Decimal(repr(centreImag)),
+                "pxSize" : pxSize,
+                "imageScale" : imageScale
+            }
+            version = 1
+            dtype = np.dtype(np.float32)
+
+    shape = (details["height"], details["width"])
+    if os.path.getsize(fname) < offset + (shape[0] * shape[1] * dtype.itemsize):
+        raise ValueError("Image data file too short for image size {0:d} x {1:d} : {2:s}".format(shape[1], shape[0], fname))
+    details["version"] = version
+    data = np.memmap(fname, dtype=dtype, mode='r', offset=offset, shape=shape)
+    if dtype == quantisedType:
+        return details, dequantiseIterations(data['whole'], data['fraction'])
+    return details, data
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import math
+import numpy as np
+from decimal import Decimal, localcontext
+from multiprocessing import shared_memory
+
+# Spare decimal digits in a reference orbit calculation.
+# Orbit can be reused for zooms at the same centre until these are used up.
+orbitSpareDigits = 10
+
+# *******************************************
+# Number of decimal digits needed for calculations at a pixel size.
+# Enough to resolve the pixel size with plenty of digits to spare.
+# *******************************************
+def decimalDigits(pxSize):
+    return max(28, int(math.ceil(-math.log10(pxSize))) + 20)
+
+# *******************************************
+# Reference orbit class for perturbation calculations.
+# Reference orbit is calculated in high precision (decimal) at the
+# image centre, and kept in a shared memory block in double precision
+# for the worker processes.
+# Orbit is cached, and reused while the centre and maximum iterations
+# don't change, e.g. when zooming at the same centre.
+# *******************************************
+class referenceOrbit():
+    # Initializer / Instance Attributes
+    def __init__(self, logger):
+
+        self.logger = logger
+        self.shm = None
+        self.length = 0
+
+        # Orbit array (in shared memory) and series approximation coefficients.
+        self.orbit = None
+        self.coeffs = None
+
+        # Details of the cached orbit.
+        self.centreReal = None
+        self.centreImag = None
+        self.maxIterations = 0
+        self.digits = 0
+
+    # *******************************************
+    # Make sure reference orbit is calculated for the view.
+    # Centre is given as decimal numbers.
+    # *******************************************
+    def update(self, centreReal, centreImag, pxSize, maxIterations):
+        digits = decimalDigits(pxSize) + orbitSpareDigits
+
+        # Reuse the cached orbit if it is for the same point and still has enough precision.
+        if ((self.shm is not None) and (centreReal == self.centreReal) and (centreImag == self.centreImag)
+            and (maxIterations == self.maxIterations) and (decimalDigits(pxSize) <= self.digits)):
+            self.logger.debug("Reusing reference orbit, length : {0:d}, digits : {1:d}".format(self.length, self.digits))
+            return
+
+        orbit = calcOrbit(centreReal, centreImag, maxIterations, digits)
+
+        # Store orbit in shared memory for the worker processes.
+        self.close()
+        self.length = orbit.size
+        self.shm = shared_memory.SharedMemory(create=True, size=orbit.nbytes)
+        self.orbit = np.ndarray(orbit.shape, dtype=np.complex128, buffer=self.shm.buf)
+        self.orbit[:] = orbit
+        self.coeffs = seriesCoefficients(self.orbit)
+
+        self.centreReal = centreReal
+        self.centreImag = centreImag
+        self.maxIterations = maxIterations
+        self.digits = digits
+        self.logger.debug("Calculated reference orbit, length : {0:d}, digits : {1:d}".format(self.length, self.digits))
+
+    # *******************************************
+    # Work out how many iterations can be skipped by series approximation.
+    # Probes are offsets from the reference point, including the furthest
+    # pixels from it (the image corners).
+    # Skip is chosen from the size of the last series term relative to the
+    # first, then checked by iterating the probes; if the series doesn't
+    # match them within the tolerance, fewer iterations are skipped.
+    # Returns iterations to skip and the series coefficients there.
+    # *******************************************
+    def seriesSkip(self, probes, tolerance):
+        a, b, c = self.coeffs
+        radius = np.abs(probes).max()
+
+        # Find last iteration where truncation error estimate is within tolerance.
+        # Can't skip past the end of the reference orbit.
+        ok = (np.abs(c) * (radius * radius)) <= (tolerance * np.abs(a))
+        ok[0] = True
+        if ok.all():
+            skip = ok.size - 1
+        else:
+            skip = int(np.argmin(ok)) - 1
+        skip = max(0, min(skip, self.length - 2))
+
+        # Iterate the probes up to the skip, stopping if any diverge.
+        delta = np.zeros(probes.size, dtype=np.complex128)
+        history = [delta]
+        for its in range (0, skip):
+            delta = (((2.0 * self.orbit[its]) + delta) * delta) + probes
+            if (np.abs(self.orbit[its + 1] + delta) >= 2.0).any():
+                skip = its
+                break
+            history.append(delta)
+
+        # Check series against probes, skipping fewer iterations until good.
+        while skip > 0:
+            series = (((((c[skip] * probes) + b[skip]) * probes) + a[skip]) * probes)
+            error = np.abs(series - history[skip])
+            if (error <= (tolerance * np.abs(history[skip]))).all():
+                break
+            skip = (skip * 3) // 4
+
+        self.logger.debug("Series approximation iterations skipped : {0:d}".format(skip))
+        return skip, (a[skip], b[skip], c[skip])
+
+    # *******************************************
+    # Name of the shared memory block, for worker processes.
+    # *******************************************
+    def name(self):
+        return self.shm.name
+
+    # *******************************************
+    # Release the shared memory block.
+    # *******************************************
+    def close(self):
+        if self.shm is not None:
+            self.orbit = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+# *******************************************
+# Calculate reference orbit for a point, in decimal precision.
+# Orbit starts at Z(0) = 0, and finishes at maximum iterations or
+# on the first value to diverge.
+# Returns orbit as array of complex doubles.
+# *******************************************
+def calcOrbit(centreReal, centreImag, maxIterations, digits):
+    orbit = np.zeros(maxIterations + 1, dtype=np.complex128)
+
+    with localcontext() as ctx:
+        ctx.prec = digits
+        cr = +centreReal
+        ci = +centreImag
+        zr = Decimal(0)
+        zi = Decimal(0)
+        length = 1
+        for its in range (1, maxIterations + 1):
+            # Mandelbrot function is Fn+1 = Fn^2 + pt
+            zr, zi = (zr * zr) - (zi * zi) + cr, (2 * zr * zi) + ci
+            orbit[its] = complex(float(zr), float(zi))
+            length += 1
+
+            # Stop on divergence.
+            if ((zr * zr) + (zi * zi)) >= 4:
+                break
+
+    return orbit[:length]
+
+# *******************************************
+# Calculate series approximation coefficients for a reference orbit.
+# Offset from the reference orbit after n iterations is approximated by
+#   d(n) = A(n).dc + B(n).dc^2 + C(n).dc^3
+# where dc is the offset of the point from the reference point.
+# Coefficients grow quickly; they stop when they get too big for doubles.
+# Returns arrays of A, B and C for each iteration of the orbit.
+# *******************************************
+def seriesCoefficients(orbit):
+    a = np.zeros(orbit.size, dtype=np.complex128)
+    b = np.zeros(orbit.size, dtype=np.complex128)
+    c = np.zeros(orbit.size, dtype=np.complex128)
+
+    length = orbit.size
+    with np.errstate(over='ignore', invalid='ignore'):
+        for its in range (0, orbit.size - 1):
+            z2 = 2.0 * orbit[its]
+            a[its + 1] = (z2 * a[its]) + 1.0
+            b[its + 1] = (z2 * b[its]) + (a[its] * a[its])
+            c[its + 1] = (z2 * c[its]) + (2.0 * a[its] * b[its])
+            if not (np.isfinite(a[its + 1]) and np.isfinite(b[its + 1]) and np.isfinite(c[its + 1])):
+                length = its + 1
+                break
+
+    return a[:length], b[:length], c[:length]
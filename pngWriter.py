@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import struct
+import zlib
+import numpy as np
+
+# PNG file signature.
+pngSignature = b'\x89PNG\r\n\x1a\n'
+
+# Compressed data is written in IDAT chunks of about this size.
+pngChunkSize = 1 << 20
+
+# *******************************************
+# PNG writer class.
+# Writes an 8 bit RGB PNG file a number of rows at a time, so that images
+# too big for memory can be written as they are made.
+# Rows are compressed as they are added, and only the compressed data not
+# yet written is kept.
+# *******************************************
+class pngWriter():
+    # Initializer / Instance Attributes
+    def __init__(self, fname, width, height, level=6):
+
+        self.width = width
+        self.height = height
+        self.rows = 0
+
+        self.file = open(fname, 'wb')
+        self.compressor = zlib.compressobj(level)
+        self.pending = []
+        self.pendingSize = 0
+
+        # Header, 8 bits per channel, colour type 2 (RGB), no interlace.
+        self.file.write(pngSignature)
+        self.writeChunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    # *******************************************
+    # Write a chunk to the file, with its length and CRC.
+    # *******************************************
+    def writeChunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)) & 0xffffffff))
+
+    # *******************************************
+    # Add rows to the image.
+    # Rows are an array of rows by columns by 3 (RGB) bytes.
+    # *******************************************
+    def writeRows(self, rgb):
+        # Each row starts with filter type 0 (none).
+        rows = np.zeros((rgb.shape[0], 1 + (self.width * 3)), dtype=np.uint8)
+        rows[:, 1:] = rgb.reshape(rgb.shape[0], self.width * 3)
+        self.addData(self.compressor.compress(rows.tobytes()))
+        self.rows += rgb.shape[0]
+
+    # *******************************************
+    # Add compressed data, writing an IDAT chunk when there is enough.
+    # *******************************************
+    def addData(self, data, final=False):
+        if len(data) > 0:
+            self.pending.append(data)
+            self.pendingSize += len(data)
+        if (self.pendingSize >= pngChunkSize) or (final and (self.pendingSize > 0)):
+            self.writeChunk(b'IDAT', b''.join(self.pending))
+            self.pending = []
+            self.pendingSize = 0
+
+    # *******************************************
+    # Finish the image and close the file.
+    # All rows must have been written.
+    # *******************************************
+    def close(self):
+        if self.rows != self.height:
+            self.file.close()
+            raise ValueError("PNG rows written {0:d}, image height {1:d}".format(self.rows, self.height))
+        self.addData(self.compressor.flush(), True)
+        self.writeChunk(b'IEND', b'')
+        self.file.close()
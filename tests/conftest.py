@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules are run from the top level of the repository, not installed.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,35 @@
+import math
+import numpy as np
+
+from colourBoundary import colourBoundary
+from imageRender import paletteTable, renderTable, tableSize
+
+try:
+    from utils import getColInRange
+except ImportError:
+    # Same calculation as utils.getColInRange, which needs Gtk.
+    def getColInRange(it, bLo, bHi):
+        ratio = (it - bLo.itLimit) / (bHi.itLimit - bLo.itLimit)
+        return tuple(lo if hi == lo else math.floor(lo + ((hi - lo) * ratio)) for lo, hi in
+            ((bLo.colRed, bHi.colRed), (bLo.colGreen, bHi.colGreen), (bLo.colBlue, bHi.colBlue)))
+
+# Palette with a band of 10 iterations from black to white at high iterations.
+maxIterations = 100000
+boundaries = [(1, 0, 0, 200), (90000, 0, 0, 0), (90010, 255, 255, 255), (maxIterations, 0, 0, 0)]
+
+def test_table_size_grows_with_iterations():
+    assert tableSize(65536, 1000) == 65536
+    assert tableSize(65536, maxIterations) > 65536
+    assert tableSize(65536, 10 ** 9) < 10 ** 9
+
+def test_palette_table_narrow_band():
+    # Values across the band, coloured from the table and per value.
+    values = np.linspace(90000.0, 90010.0, 2001)
+    rgb = np.empty((values.size, 3), dtype=np.uint8)
+    renderTable(values, paletteTable(boundaries, maxIterations, 65536), maxIterations, rgb)
+    bLo = colourBoundary(*boundaries[1])
+    bHi = colourBoundary(*boundaries[2])
+    expected = np.array([getColInRange(v, bLo, bHi) for v in values])
+
+    assert np.abs(rgb.astype(np.int64) - expected).max() <= 1
+    assert np.unique(rgb[:, 0]).size > 200
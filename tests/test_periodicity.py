@@ -0,0 +1,51 @@
+import time
+import numpy as np
+
+from imageCalc import escapeTime, viewPoints
+
+# *******************************************
+# Points of a square view.
+# *******************************************
+def viewGrid(centreReal, centreImag, pxSize, size):
+    rows, cols = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    real, imag = viewPoints(centreReal, centreImag, pxSize, size, size, rows.ravel(), cols.ravel())
+    return real + (1j * imag)
+
+# *******************************************
+# Best times of a number of runs of escapeTime with and without the
+# periodicity check, run in turn so that both see the same machine load.
+# *******************************************
+def bestTimes(c, maxIterations, periodTolerance, runs=7):
+    best = [None, None]
+    for run in range (runs):
+        for index, tolerance in enumerate((periodTolerance, 0.0)):
+            startTime = time.perf_counter()
+            escapeTime(c, maxIterations, True, None, tolerance)
+            seconds = time.perf_counter() - startTime
+            best[index] = seconds if best[index] is None else min(best[index], seconds)
+    return best
+
+# Boundary views with very few interior pixels.
+escapeViews = [(-1.7687, 0.0017, 2e-6, 3000), (-0.7435, 0.1314, 2e-6, 3000)]
+
+def test_periodicity_check_same_values():
+    for centreReal, centreImag, pxSize, maxIterations in escapeViews + [(-0.1, 0.8, 5e-4, 1000)]:
+        c = viewGrid(centreReal, centreImag, pxSize, 100)
+        stats = {}
+        checked = escapeTime(c, maxIterations, True, stats, 1e-3 * pxSize)
+        unchecked = escapeTime(c, maxIterations, True, None, 0.0)
+        assert np.array_equal(checked, unchecked)
+
+def test_periodicity_check_finds_interior():
+    c = viewGrid(-0.1, 0.8, 5e-4, 100)
+    stats = {}
+    escapeTime(c, 1000, True, stats, 5e-7)
+    assert stats["periodic"] > c.size // 2
+
+def test_periodicity_check_not_slower_escaping():
+    # Benchmark: check shouldn't cost more than timing noise on views
+    # of mostly escaping points.
+    for centreReal, centreImag, pxSize, maxIterations in escapeViews:
+        c = viewGrid(centreReal, centreImag, pxSize, 200)
+        checked, unchecked = bestTimes(c, maxIterations, 1e-3 * pxSize)
+        assert checked < 1.15 * unchecked, (centreReal, centreImag, checked, unchecked)
@@ -0,0 +1,46 @@
+import numpy as np
+
+import imageCalc
+from imageCalc import calcBox, calcSubdivide
+
+# *******************************************
+# Tile job for a view, as for viewCalc.tileJob.
+# *******************************************
+def viewJob(centreReal, centreImag, pxSize, size, maxIterations):
+    return {
+        "centreReal" : centreReal,
+        "centreImag" : centreImag,
+        "pxSize" : pxSize,
+        "imageWidth" : size,
+        "imageHeight" : size,
+        "maxIterations" : maxIterations,
+        "cardioidCheck" : True,
+        "periodTolerance" : 0.0,
+        "subdivideMinSize" : 8,
+        "orbitName" : None
+    }
+
+# View of mostly escape bands, outside the set to the left.
+bandView = (-2.3, 0.0, 0.002, 128, 200)
+
+def test_subdivide_same_values():
+    for centreReal, centreImag, pxSize, size, maxIterations in [bandView, (-0.55, 0.0, 0.02, 128, 200)]:
+        job = viewJob(centreReal, centreImag, pxSize, size, maxIterations)
+        whole = calcBox(job, (0, size), (0, size))
+        subdivided = calcSubdivide(job, (0, size), (0, size))
+        assert np.array_equal(whole, subdivided)
+
+def test_subdivide_fills_escape_bands(monkeypatch):
+    # Count pixels iterated in full.
+    iterated = [0]
+    calcPoints = imageCalc.calcPoints
+    def countPoints(job, rows, cols, stats=None, state=None):
+        iterated[0] += rows.size
+        return calcPoints(job, rows, cols, stats, state)
+    monkeypatch.setattr(imageCalc, "calcPoints", countPoints)
+
+    centreReal, centreImag, pxSize, size, maxIterations = bandView
+    stats = {}
+    calcSubdivide(viewJob(centreReal, centreImag, pxSize, size, maxIterations), (0, size), (0, size), stats)
+    assert stats["subdivideFilled"] > (size * size) // 2
+    assert iterated[0] < (size * size) // 2
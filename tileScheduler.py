@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import os
+import multiprocessing
+import concurrent.futures
+
+from imageCalc import *
+
+# *******************************************
+# Tile scheduler class.
+# Splits image boxes into tiles and calculates them on a process pool.
+# Processes avoid the GIL, so all cores can be used.
+# *******************************************
+class tileScheduler():
+    # Initializer / Instance Attributes
+    def __init__(self, logger, workers, tileSize):
+
+        self.logger = logger
+
+        # Number of worker processes, 0 means use all cores.
+        if workers > 0:
+            self.workers = workers
+        else:
+            self.workers = os.cpu_count()
+
+        # Tile size in pixels (tiles are square).
+        self.tileSize = tileSize
+
+        # Process pool, created on first use.
+        self.pool = None
+
+        # Futures of tiles submitted and not yet cancelled.
+        self.futures = []
+
+        self.logger.debug("Tile scheduler workers : {0:d}, tile size : {1:d}".format(self.workers, self.tileSize))
+
+    # *******************************************
+    # Split row and column ranges (box) into tiles.
+    # Ranges as for imageCalc, i.e. end of range not included.
+    # *******************************************
+    def splitBox(self, rowRange, colRange):
+        tiles = []
+        for r in range (rowRange[0], rowRange[1], self.tileSize):
+            for c in range (colRange[0], colRange[1], self.tileSize):
+                tiles.append(((r, min(r + self.tileSize, rowRange[1])), (c, min(c + self.tileSize, colRange[1]))))
+        return tiles
+
+    # *******************************************
+    # Get the process pool, creating it if not done yet.
+    # Workers are forked so that they don't re-run the main program.
+    # *******************************************
+    def getPool(self):
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+        return self.pool
+
+    # *******************************************
+    # Calculate a list of tile jobs on the process pool.
+    # Waits for the tiles, and returns the list of tile results.
+    # *******************************************
+    def run(self, jobs):
+        return list(self.getPool().map(calcTile, jobs))
+
+    # *******************************************
+    # Calculate a list of tile jobs on the process pool.
+    # Yields the result of each tile as it finishes, in any order.
+    # *******************************************
+    def results(self, jobs):
+        pool = self.getPool()
+        futures = [pool.submit(calcTile, job) for job in jobs]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    # *******************************************
+    # Start calculating a list of tile jobs on the process pool.
+    # Doesn't wait; done is called with the future of each tile when it
+    # finishes or is cancelled. Note done is called from a pool thread
+    # (or straight away if the tile is already done).
+    # *******************************************
+    def submit(self, jobs, done):
+        pool = self.getPool()
+        self.futures = [future for future in self.futures if not future.done()]
+        for job in jobs:
+            future = pool.submit(calcTile, job)
+            self.futures.append(future)
+            future.add_done_callback(done)
+
+    # *******************************************
+    # Cancel tiles submitted that haven't started yet.
+    # Tiles already being calculated run to the end.
+    # *******************************************
+    def cancel(self):
+        cancelled = 0
+        for future in self.futures:
+            if future.cancel():
+                cancelled += 1
+        self.futures = []
+        if cancelled > 0:
+            self.logger.debug("Tiles cancelled : {0:d}".format(cancelled))
+
+    # *******************************************
+    # Shut down the process pool.
+    # Tiles not yet started are cancelled.
+    # *******************************************
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import logging
+import logging.handlers
+import numpy as np
+
+from imageCalc import *
+from perturbation import *
+
+# *******************************************
+# View calculation class.
+# Calculation settings, reference orbit and tile jobs for calculating a
+# view on the tile scheduler. Shared by the GUI (Mandelbrot) and the
+# headless renderers (viewRender), so that calculation options are only
+# set up in one place.
+# Classes using it hold the view (centreReal, centreImag, pxSize,
+# imageScale, imageWidth, imageHeight, maxIterations) and the iteration
+# buffer (iterBuffer).
+# *******************************************
+class viewCalc():
+
+    # *******************************************
+    # Set up calculation settings from the configuration file.
+    # *******************************************
+    def initCalc(self, config, logger):
+        calc = config["Calculations"]
+
+        # Skip iterating points in the main cardioid and period-2 bulb.
+        self.cardioidCheck = calc["CardioidCheck"]
+
+        # Stop iterating points whose orbit is periodic.
+        # Tolerance for orbit repeating is a fraction of pixel size.
+        self.periodCheck = calc["PeriodicityCheck"]
+        self.periodTolFraction = calc["PeriodicityTolerance"]
+
+        # Calculate by rectangle subdivision, filling rectangles with uniform borders.
+        self.subdivide = calc["Subdivide"]
+        self.subdivideMinSize = calc["SubdivideMinSize"]
+
+        # Perturbation calculations from a high precision reference orbit,
+        # used for pixel sizes below the threshold (deep zooms).
+        self.perturbPxSize = calc["PerturbationPixelSize"]
+        self.refOrbit = referenceOrbit(logger)
+
+        # Series approximation to skip iterations in deep zooms.
+        self.seriesApprox = calc["SeriesApproximation"]
+        self.seriesTolerance = calc["SeriesTolerance"]
+        self.seriesSkip = 0
+        self.seriesCoeffs = None
+
+    # *******************************************
+    # Get the reference orbit for deep zooms, for the current view.
+    # Work out iterations that can be skipped using series approximation.
+    # *******************************************
+    def updateReference(self):
+        self.seriesSkip = 0
+        self.seriesCoeffs = None
+        if self.deepZoom():
+            self.refOrbit.update(self.centreReal, self.centreImag, self.pxSize, self.maxIterations)
+            if self.seriesApprox:
+                self.seriesSkip, self.seriesCoeffs = self.refOrbit.seriesSkip(self.seriesProbes(), self.seriesTolerance)
+
+    # *******************************************
+    # Check if image is a deep zoom, needing perturbation calculations.
+    # *******************************************
+    def deepZoom(self):
+        return self.pxSize < self.perturbPxSize
+
+    # *******************************************
+    # Probe points for checking series approximation.
+    # Offsets from the image centre of the corners, edge centres and centre.
+    # *******************************************
+    def seriesProbes(self):
+        rows, cols = np.meshgrid([0, self.imageHeight // 2, self.imageHeight - 1], [0, self.imageWidth // 2, self.imageWidth - 1], indexing='ij')
+        real, imag = viewPoints(0.0, 0.0, self.pxSize, self.imageWidth, self.imageHeight, rows.ravel(), cols.ravel())
+        return real + (1j * imag)
+
+    # *******************************************
+    # Tolerance for detecting periodic orbits.
+    # Scales with pixel size; zero if periodicity check not in use.
+    # *******************************************
+    def periodTolerance(self):
+        if self.periodCheck:
+            return self.periodTolFraction * self.pxSize
+        return 0.0
+
+    # *******************************************
+    # Create tile calculation job for the tile scheduler.
+    # Job holds the details of the current view and the tile box,
+    # and optionally the selection of pixels in the tile to calculate,
+    # and whether to keep state of pixels reaching maximum iterations,
+    # and the rows of the tile to put into histogram bins.
+    # Reference orbit is passed by shared memory name; calculations in this
+    # process can set orbit to the reference orbit array instead.
+    # *******************************************
+    def tileJob(self, rowRange, colRange, selection=None, keepState=False, histRows=None):
+        return {
+            "rowRange" : rowRange,
+            "colRange" : colRange,
+            "selection" : selection,
+            "keepState" : keepState,
+            "histRows" : histRows,
+            "resume" : None,
+            "centreReal" : float(self.centreReal),
+            "centreImag" : float(self.centreImag),
+            "pxSize" : self.pxSize,
+            "imageWidth" : self.imageWidth,
+            "imageHeight" : self.imageHeight,
+            "maxIterations" : self.maxIterations,
+            "cardioidCheck" : self.cardioidCheck,
+            "periodTolerance" : self.periodTolerance(),
+            "subdivide" : self.subdivide,
+            "subdivideMinSize" : self.subdivideMinSize,
+            "orbitName" : self.refOrbit.name() if self.deepZoom() else None,
+            "orbitLength" : self.refOrbit.length,
+            "orbit" : None,
+            "seriesSkip" : self.seriesSkip,
+            "seriesCoeffs" : self.seriesCoeffs,
+            "bufferName" : self.iterBuffer.name(),
+            "bufferFirstRow" : self.iterBuffer.firstRow,
+            "bufferHeight" : self.iterBuffer.height
+        }
+
+    # *******************************************
+    # View details for a checkpoint of the image.
+    # *******************************************
+    def checkpointView(self):
+        return {
+            "centreReal" : str(self.centreReal),
+            "centreImag" : str(self.centreImag),
+            "pxSize" : self.pxSize,
+            "imageScale" : self.imageScale,
+            "imageWidth" : self.imageWidth,
+            "imageHeight" : self.imageHeight,
+            "maxIterations" : self.maxIterations
+        }